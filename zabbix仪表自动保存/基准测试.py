@@ -0,0 +1,349 @@
+"""离线基准测试：在本地启动模拟的Zabbix仪表盘服务，对不同主机数量运行完整的截图和数据提取流程
+
+用法示例：
+    python 基准测试.py                          # 浏览器模式，4/50/500台主机
+    python 基准测试.py --mode api --sizes 4 50  # API采集模式
+    python 基准测试.py --serve 50               # 只启动模拟服务，便于手动调试
+"""
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+# 模拟仪表盘的ID，每台主机占一个页面（第1页对应第1台主机）
+FAKE_DASHBOARD_ID = 1000
+# 模拟主机写入检查表的起始行，放在模板已有内容之后，避免与合并单元格冲突
+FIRST_ROW = 30
+# 模拟仪表盘上的小部件，顺序与真实仪表盘的SVG序号一致：(标题, 监控项键值)
+FAKE_WIDGETS = [
+    ("C: 使用率", "vfs.fs.size[C:,pused]"),
+    ("D: 使用率", "vfs.fs.size[D:,pused]"),
+    ("CPU 使用率", "system.cpu.util"),
+    ("网络流量", "net.if.in[\"eth0\"]"),
+    ("内存使用率", "vm.memory.util"),
+]
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><title>Zabbix</title></head><body>
+<form method="post" action="index.php">
+<input type="text" name="name"><input type="password" name="password">
+<button type="submit" name="enter" value="Sign in">Sign in</button>
+</form></body></html>"""
+
+WIDGET_TEMPLATE = """<div class="dashboard-grid-widget is-loading">
+<div class="dashboard-grid-widget-header"><h4>{title}</h4></div>
+<div class="dashboard-grid-widget-contents"><svg width="320" height="200">
+<path d="M10 180 A150 150 0 0 1 310 180" stroke="#ccc" fill="none"></path>
+<text class="svg-gauge-value-and-units svg-gauge-value-and-units-horizontal" x="160" y="150"><tspan class="svg-gauge-value">{value}</tspan> <tspan class="svg-gauge-units">%</tspan></text>
+</svg></div></div>"""
+
+DASHBOARD_PAGE = """<!DOCTYPE html>
+<html><head><title>Dashboard: {host}</title>
+<style>body {{ margin: 0; }} .dashboard-grid {{ margin: 120px 0 0 180px; width: 1670px; }}
+.dashboard-grid-widget {{ display: inline-block; width: 540px; height: 360px; }}</style></head>
+<body><div class="dashboard-grid">{widgets}</div>
+<script>
+setTimeout(function () {{
+    var nodes = document.querySelectorAll('.is-loading');
+    for (var i = 0; i < nodes.length; i++) {{
+        nodes[i].classList.remove('is-loading');
+    }}
+}}, {render_delay});
+</script></body></html>"""
+
+def fake_host_name(index):
+    return f"HOST{index + 1:03d}"
+
+def fake_value(host, item_key):
+    """每台主机每个监控项的固定模拟值，浏览器和API看到的数值一致"""
+    return f"{zlib.crc32(f'{host}|{item_key}'.encode('utf-8')) % 9000 / 100:.2f}"
+
+class FakeZabbixHandler(BaseHTTPRequestHandler):
+    """模拟Zabbix前端的登录页、仪表盘页面和 api_jsonrpc.php"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _logged_in(self):
+        cookie = self.headers.get("Cookie", "")
+        return any(part.strip() in self.server.sessions for part in cookie.split(";"))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/favicon.ico":
+            self._send(204)
+        elif url.path in ("/", "/index.php"):
+            if self._logged_in():
+                self._send(302, headers={"Location": "/zabbix.php?action=dashboard.view"})
+            else:
+                self._send(200, LOGIN_PAGE.encode("utf-8"))
+        elif url.path == "/zabbix.php" and query.get("action") == ["dashboard.view"]:
+            if not self._logged_in():
+                self._send(200, LOGIN_PAGE.encode("utf-8"))
+                return
+            page = int(query.get("page", ["1"])[0])
+            host = fake_host_name(page - 1)
+            widgets = "".join(
+                WIDGET_TEMPLATE.format(title=f"{host}: {title}", value=fake_value(host, item_key))
+                for title, item_key in FAKE_WIDGETS
+            )
+            time.sleep(self.server.response_delay)
+            body = DASHBOARD_PAGE.format(host=host, widgets=widgets, render_delay=self.server.render_delay_ms)
+            self._send(200, body.encode("utf-8"))
+        else:
+            self._send(404)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if url.path == "/index.php":
+            token = f"zbx_session={uuid.uuid4().hex}"
+            self.server.sessions.add(token)
+            self._send(302, headers={"Location": "/zabbix.php?action=dashboard.view", "Set-Cookie": f"{token}; Path=/"})
+        elif url.path == "/api_jsonrpc.php":
+            request = json.loads(body.decode("utf-8"))
+            result = self._api(request["method"], request.get("params", {}))
+            response = json.dumps({"jsonrpc": "2.0", "result": result, "id": request.get("id")})
+            self._send(200, response.encode("utf-8"), "application/json-rpc")
+        else:
+            self._send(404)
+
+    def _api(self, method, params):
+        if method == "apiinfo.version":
+            return "6.0.0"
+        if method == "user.login":
+            return uuid.uuid4().hex
+        if method == "host.get":
+            names = params.get("filter", {}).get("host") or params.get("filter", {}).get("name") or []
+            return [{"hostid": name, "host": name, "name": name} for name in names if name.startswith("HOST")]
+        if method == "item.get":
+            now = str(int(time.time()))
+            return [
+                {"itemid": f"{hostid}|{key}", "hostid": hostid, "key_": key, "lastvalue": fake_value(hostid, key),
+                 "lastclock": now, "units": "%", "value_type": "0"}
+                for hostid in params.get("hostids", [])
+                for key in params.get("filter", {}).get("key_", [])
+            ]
+        if method == "history.get":
+            return []
+        return []
+
+def start_fake_zabbix(render_delay_ms=300, response_delay=0.0):
+    """在随机端口启动模拟Zabbix服务，返回 (server, 基础URL)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeZabbixHandler)
+    server.daemon_threads = True
+    server.sessions = set()
+    server.render_delay_ms = render_delay_ms
+    server.response_delay = response_delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def build_inventory(base_urls, host_count, gauges):
+    """生成主机清单，多个模拟服务时主机按顺序轮流分配到各服务器"""
+    inventory = {"dashboard_id": FAKE_DASHBOARD_ID, "gauges": gauges}
+    hosts = [{"label": fake_host_name(i), "page": i + 1, "row": FIRST_ROW + i} for i in range(host_count)]
+    if len(base_urls) == 1:
+        inventory["server"] = {"url": base_urls[0], "username": "guest", "password": ""}
+    else:
+        inventory["servers"] = {
+            f"site{n + 1}": {"url": url, "username": "guest", "password": ""} for n, url in enumerate(base_urls)
+        }
+        for i, host in enumerate(hosts):
+            host["server"] = f"site{i % len(base_urls) + 1}"
+    inventory["hosts"] = hosts
+    return inventory
+
+def percentile(values, percent):
+    """最近秩法计算百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def prepare_work_dir(checker, base_urls, host_count, gauges, work_dir):
+    """创建独立的工作目录（主机清单、检查表模板），并把巡检脚本的所有运行时文件指向该目录"""
+    os.makedirs(work_dir)
+    inventory_path = os.path.join(work_dir, "主机清单.json")
+    with open(inventory_path, "w", encoding="utf-8") as f:
+        json.dump(build_inventory(base_urls, host_count, gauges), f, ensure_ascii=False, indent=2)
+
+    # 使用真实的检查表模板，没有时生成空白工作簿
+    template = os.path.join(SCRIPT_DIR, "日常检查表.xlsx")
+    if os.path.exists(template):
+        shutil.copy2(template, os.path.join(work_dir, "日常检查表.xlsx"))
+    else:
+        from openpyxl import Workbook
+        Workbook().save(os.path.join(work_dir, "日常检查表.xlsx"))
+
+    checker.INVENTORY_PATH = inventory_path
+    checker.SESSION_CACHE_PATH = os.path.join(work_dir, "会话缓存.json")
+    checker.METRICS_DB_PATH = os.path.join(work_dir, "指标历史.db")
+    checker.LOAD_TIMES_PATH = os.path.join(work_dir, "页面耗时.json")
+    checker.LOCATOR_CACHE_PATH = os.path.join(work_dir, "仪表定位缓存.json")
+
+def run_in_dir(checker, work_dir, trace_memory=False, capture=True):
+    """在工作目录中运行一次完整流程，返回 (运行报告, 耗时, Python堆峰值字节数)；不跟踪内存时峰值为None。
+    capture为False时只采集数据不截图"""
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    peak = None
+    try:
+        report = checker.take_screenshots(capture=capture)
+    finally:
+        elapsed = time.perf_counter() - start
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        os.chdir(cwd)
+    return report, elapsed, peak
+
+def run_benchmark(checker, base_urls, host_count, work_dir, measure_memory=True, capture=True):
+    """对host_count台主机运行一次完整流程并计时，返回测量结果。
+    tracemalloc会拖慢每次内存分配，内存在另一个全新工作目录中单独运行一遍测量，不影响计时"""
+    with open(os.path.join(SCRIPT_DIR, "主机清单.json"), encoding="utf-8") as f:
+        gauges = json.load(f)["gauges"]
+
+    prepare_work_dir(checker, base_urls, host_count, gauges, work_dir)
+    report, elapsed, _ = run_in_dir(checker, work_dir, capture=capture)
+
+    peak = None
+    if measure_memory:
+        memory_dir = f"{work_dir}_memory"
+        prepare_work_dir(checker, base_urls, host_count, gauges, memory_dir)
+        _, _, peak = run_in_dir(checker, memory_dir, trace_memory=True, capture=capture)
+
+    summary = report.to_dict() if report is not None else {}
+    latencies = [page["stages"].get("page_total") for page in summary.get("pages", {}).values()]
+    latencies = [latency for latency in latencies if latency is not None]
+    return {
+        "hosts": host_count,
+        "seconds": round(elapsed, 3),
+        "hosts_per_second": round(host_count / elapsed, 2) if elapsed else None,
+        "page_latency_p50": percentile(latencies, 50),
+        "page_latency_p90": percentile(latencies, 90),
+        "page_latency_p99": percentile(latencies, 99),
+        # 只统计本进程的Python堆，不含浏览器进程
+        "peak_python_heap_mb": round(peak / 1024 / 1024, 1) if peak is not None else None,
+        "gauges_ok": summary.get("gauges_ok"),
+        "gauges_failed": summary.get("gauges_failed"),
+        "webdriver_calls": summary.get("webdriver_calls", {}).get("total"),
+        "stages": summary.get("stages", {}),
+    }
+
+def print_results(results):
+    header = f"{'主机数':>6} {'总耗时(s)':>10} {'主机/秒':>8} {'p50(s)':>8} {'p90(s)':>8} {'p99(s)':>8} {'Python堆峰值(MB)':>14} {'成功/失败':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        def fmt(value):
+            return f"{value:.3f}" if isinstance(value, (int, float)) else "-"
+        def fmt_mb(value):
+            return f"{value:.1f}" if value is not None else "-"
+        print(f"{r['hosts']:>6} {r['seconds']:>10.3f} {r['hosts_per_second'] or 0:>8.2f} {fmt(r['page_latency_p50']):>8} "
+              f"{fmt(r['page_latency_p90']):>8} {fmt(r['page_latency_p99']):>8} {fmt_mb(r['peak_python_heap_mb']):>14} "
+              f"{r['gauges_ok']}/{r['gauges_failed']:>4}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="使用本地模拟Zabbix服务对截图和数据提取流程做基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 50, 500], help="要测试的主机数量，默认 4 50 500")
+    parser.add_argument("--mode", choices=["browser", "api"], default="browser", help="指标采集方式")
+    parser.add_argument("--concurrency", type=int, default=None, help="并发浏览器会话数，默认沿用脚本配置")
+    parser.add_argument("--render-delay", type=int, default=300, help="模拟小部件渲染耗时（毫秒）")
+    parser.add_argument("--response-delay", type=float, default=0.0, help="模拟服务端响应耗时（秒）")
+    parser.add_argument("--output", help="把结果另存为JSON文件")
+    parser.add_argument("--skip-memory", action="store_true", help="不单独运行一遍测量Python堆峰值")
+    parser.add_argument("--keep", action="store_true", help="保留每次运行的工作目录")
+    parser.add_argument("--verbose", action="store_true", help="输出巡检脚本的详细日志")
+    parser.add_argument("--servers", type=int, default=1, help="模拟的Zabbix服务器数量，主机轮流分配到各服务器")
+    parser.add_argument("--serve", type=int, metavar="主机数", help="只启动模拟服务并打印主机清单，按Ctrl+C退出")
+    args = parser.parse_args(argv)
+
+    fakes = [start_fake_zabbix(args.render_delay, args.response_delay) for _ in range(max(1, args.servers))]
+    base_urls = [base_url for _, base_url in fakes]
+
+    if args.serve:
+        print(f"模拟Zabbix服务: {', '.join(base_urls)}")
+        print(json.dumps(build_inventory(base_urls, args.serve, []), ensure_ascii=False, indent=2))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            return
+
+    checker = importlib.import_module("自动日常检查")
+    checker.setup_logging()
+    if not args.verbose:
+        checker.logger.setLevel(logging.WARNING)
+    checker.COLLECT_MODE = args.mode
+    checker.ZABBIX_API_URL = ""
+    checker.ZABBIX_API_TOKEN = ""
+    if checker.EDGE_DRIVER_PATH == "":
+        checker.EDGE_DRIVER_PATH = os.path.join(SCRIPT_DIR, "msedgedriver.exe")
+    if args.concurrency is not None:
+        checker.CAPTURE_CONCURRENCY = args.concurrency
+
+    # 没有驱动时浏览器会话全部失败，测出的吞吐量没有意义：浏览器模式直接退出，API模式只测数据采集
+    capture = os.path.exists(checker.EDGE_DRIVER_PATH)
+    if not capture:
+        if args.mode == "browser":
+            print(f"Edge驱动文件不存在: {checker.EDGE_DRIVER_PATH}，无法测试浏览器模式", file=sys.stderr)
+            for server, _ in fakes:
+                server.shutdown()
+            sys.exit(1)
+        print(f"Edge驱动文件不存在: {checker.EDGE_DRIVER_PATH}，只测试API数据采集，不截图")
+    label = args.mode if capture else f"{args.mode}（不截图）"
+
+    root = tempfile.mkdtemp(prefix="zabbix_bench_")
+    results = []
+    try:
+        for size in args.sizes:
+            print(f"运行 {size} 台主机（{label}模式）...")
+            work_dir = os.path.join(root, f"{size}_{datetime.now().strftime('%H%M%S')}")
+            results.append(run_benchmark(checker, base_urls, size, work_dir, not args.skip_memory, capture))
+    finally:
+        for server, _ in fakes:
+            server.shutdown()
+        if args.keep:
+            print(f"工作目录已保留: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "capture": capture, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,478 @@
-from selenium import webdriver
-from selenium.webdriver.edge.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 import time
-from datetime import datetime
+# 模块开始加载的时间，用于统计启动耗时
+PROCESS_START = time.perf_counter()
+from datetime import datetime, timedelta
 import os
-from PIL import Image, ImageDraw
-from openpyxl import load_workbook
 import logging
+import importlib
 import traceback
 import sys
+import re
+import tempfile
+import threading
+import json
+import csv
+import http.client
+import urllib.parse
+import urllib.request
+import io
+import base64
+import math
+import hashlib
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('网页截图_debug.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-def create_date_folder(date_str):
-    """创建以日期命名的文件夹"""
+def setup_logging():
+    """配置日志输出到控制台和调试日志文件，由入口调用，导入本模块时不创建日志文件"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('网页截图_debug.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+# 等待仪表盘就绪的最长时间（秒），可通过环境变量 ZABBIX_READY_TIMEOUT 调整
+PAGE_READY_TIMEOUT = float(os.environ.get("ZABBIX_READY_TIMEOUT", "15"))
+# 就绪状态轮询间隔（秒）
+READY_POLL_INTERVAL = 0.2
+# 并发浏览器会话数，1表示顺序执行，可通过环境变量 ZABBIX_CAPTURE_CONCURRENCY 调整
+CAPTURE_CONCURRENCY = int(os.environ.get("ZABBIX_CAPTURE_CONCURRENCY", "1"))
+
+# 单个页面导航的最长时间（秒），超过后放弃该次访问，避免个别慢主机拖住整个工作线程
+PAGE_LOAD_TIMEOUT = float(os.environ.get("ZABBIX_PAGE_LOAD_TIMEOUT", "30"))
+# 失败页面的最大重试次数，重试的页面排到队尾，等待时间按次数指数增长且不超过上限（秒）
+PAGE_MAX_RETRIES = int(os.environ.get("ZABBIX_PAGE_RETRIES", "2"))
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 10.0
+# 整次运行的截止时间（秒），到期后不再开始新的页面，未完成的页面记录失败标记；0表示不限制
+RUN_DEADLINE = float(os.environ.get("ZABBIX_RUN_DEADLINE", "1800"))
+# 按主机记录的历史页面加载耗时，用于自适应设置就绪等待超时：耗时均值的倍数加余量，限制在上下限之间
+LOAD_TIMES_PATH = os.environ.get("ZABBIX_LOAD_TIMES", os.path.join(os.getcwd(), "页面耗时.json"))
+ADAPTIVE_TIMEOUT_FACTOR = 3.0
+ADAPTIVE_TIMEOUT_MARGIN = 2.0
+ADAPTIVE_TIMEOUT_MIN = 5.0
+# 耗时均值的平滑系数，越大越偏向最近几次的耗时
+LOAD_TIME_SMOOTHING = 0.3
+
+# Edge驱动路径，未配置时使用当前目录下的 msedgedriver.exe
+EDGE_DRIVER_PATH = os.environ.get("ZABBIX_EDGE_DRIVER", "")
+
+# 仪表盘截图的裁剪区域（左, 上, 右, 下）
+SCREENSHOT_CROP_BOX = (180, 120, 1850, 870)
+# 设为1时通过浏览器区域截图只截取裁剪区域，不再编码和解码整页截图
+SCREENSHOT_CLIP = os.environ.get("ZABBIX_SCREENSHOT_CLIP", "0") == "1"
+
+# 指标采集方式：browser 从仪表盘SVG读取；api 通过Zabbix JSON-RPC接口读取，浏览器只负责截图
+COLLECT_MODE = os.environ.get("ZABBIX_COLLECT_MODE", "browser")
+# Zabbix API地址和认证信息，只用于顶层 server（default）；未配置地址时使用主机清单中的Zabbix地址，未配置API令牌时使用清单中的账户登录。
+# servers 中的其他服务器使用各自的 api_url、api_token
+ZABBIX_API_URL = os.environ.get("ZABBIX_API_URL", "")
+ZABBIX_API_TOKEN = os.environ.get("ZABBIX_API_TOKEN", "")
+
+# 会话缓存文件：保存登录后的Zabbix会话Cookie，下次运行时先验证复用，失效时才走表单登录
+SESSION_CACHE_PATH = os.environ.get("ZABBIX_SESSION_CACHE", os.path.join(os.getcwd(), "会话缓存.json"))
+# 浏览器Cookie中可以原样写回的字段
+SESSION_COOKIE_FIELDS = ('name', 'value', 'path', 'secure', 'httpOnly', 'expiry', 'sameSite')
+
+# 历史指标库：每次运行解析出的仪表盘数值追加到SQLite中，可按时间段和主机查询趋势
+METRICS_DB_PATH = os.environ.get("ZABBIX_METRICS_DB", os.path.join(os.getcwd(), "指标历史.db"))
+
+# 告警：清单中仪表盘配置的 threshold（超过即告警）和 max_delta（与上次运行相比的最大变化量），
+# 告警写入日期文件夹，配置地址时同时以JSON POST到该地址
+ALERT_WEBHOOK_URL = os.environ.get("ZABBIX_ALERT_WEBHOOK", "")
+ALERT_WEBHOOK_TIMEOUT = 10
+
+# 截图库：配置目录后各主机截图按像素内容去重存放在该目录中，日期和主机到图片的对应关系记录在索引库里。
+# 像素完全相同时直接引用已有图片；感知哈希距离不超过 IMAGE_HASH_DISTANCE 的近似图片还要逐像素比较，
+# 每个像素各通道的差都不超过 IMAGE_PIXEL_TOLERANCE 时才引用（仪表数值变化会超出），IMAGE_HASH_DISTANCE 为0时只引用完全相同的图片；
+# 未配置时截图照常保存到日期文件夹
+IMAGE_STORE_DIR = os.environ.get("ZABBIX_IMAGE_STORE", "")
+IMAGE_HASH_DISTANCE = int(os.environ.get("ZABBIX_IMAGE_HASH_DISTANCE", "2"))
+IMAGE_PIXEL_TOLERANCE = int(os.environ.get("ZABBIX_IMAGE_PIXEL_TOLERANCE", "8"))
+
+# 结果输出方式：template 复制日常检查表模板并在运行结束时写入（默认）；csv 逐行追加到日期文件夹的 检查结果.csv；
+# xlsx 以openpyxl只写模式逐行写出 检查结果_时间.xlsx。后两种不复制模板，内存占用不随主机数量增长，
+# 格式化的日常检查表由 render 子命令按需生成
+OUTPUT_MODE = os.environ.get("ZABBIX_OUTPUT_MODE", "template")
+STREAM_OUTPUT_MODES = ('csv', 'xlsx')
+
+# 采样模式：页面打开后不刷新，在 SAMPLE_WINDOW 秒内均匀读取 SAMPLE_COUNT 次仪表盘数值，统计最小/平均/最大/P95，
+# 写入运行报告和仪表盘配置的 stats_column 列；单元格中的数值仍为第一次读数。1表示只读取一次
+SAMPLE_COUNT = int(os.environ.get("ZABBIX_SAMPLE_COUNT", "1"))
+SAMPLE_WINDOW = float(os.environ.get("ZABBIX_SAMPLE_WINDOW", "60"))
+
+# 仪表盘定位缓存：记录每个仪表盘页面上各仪表盘所在小部件的标题，之后按标题定位，小部件调整顺序后仍能取到正确的数值；
+# 缓存的标题在页面上找不到或不唯一时，按清单中的 header 或 index 重新定位并更新缓存
+LOCATOR_CACHE_PATH = os.environ.get("ZABBIX_LOCATOR_CACHE", os.path.join(os.getcwd(), "仪表定位缓存.json"))
+
+# 主机清单文件：每台主机的仪表盘页面、名称、Excel行号以及要提取的仪表盘
+INVENTORY_PATH = os.environ.get("ZABBIX_INVENTORY", os.path.join(os.getcwd(), "主机清单.json"))
+
+# 常驻模式：每天自动运行的时间点（HH:MM，逗号分隔），以及只监听本机的手动触发接口端口
+DAEMON_SCHEDULE = os.environ.get("ZABBIX_DAEMON_SCHEDULE", "08:30")
+DAEMON_PORT = int(os.environ.get("ZABBIX_DAEMON_PORT", "8765"))
+# 等待下次计划运行时每次阻塞的最长时间（秒），保证能及时响应Ctrl+C
+DAEMON_WAIT_SLICE = 1.0
+
+# 重量级依赖在用到时才导入，各子命令只加载自己需要的部分
+DEPENDENCY_MODULES = {
+    'selenium': (
+        'selenium.webdriver',
+        'selenium.webdriver.edge.service',
+        'selenium.webdriver.common.by',
+        'selenium.webdriver.support.ui',
+        'selenium.webdriver.support.expected_conditions',
+        'selenium.common.exceptions',
+    ),
+    'PIL': ('PIL.Image', 'PIL.ImageDraw', 'PIL.ImageFont'),
+    'openpyxl': ('openpyxl',),
+}
+
+# 判断仪表盘是否渲染完成：文档加载完毕、已创建小部件且没有小部件处于加载中
+DASHBOARD_READY_SCRIPT = """
+if (document.readyState !== 'complete') {
+    return false;
+}
+if (!document.querySelector('.dashboard-grid-widget')) {
+    return false;
+}
+return document.querySelector('.dashboard-grid .is-loading, .dashboard-grid-widget.is-loading') === null;
+"""
+
+class RunReport:
+    """记录一次运行的各阶段耗时、WebDriver调用次数和每个仪表盘的提取结果，运行结束时输出JSON报告"""
+    
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.webdriver_calls = {}
+        self.pages = {}
+        self.alerts = []
+        self.lock = threading.Lock()
+    
+    def _page(self, label):
+        return self.pages.setdefault(label, {'status': None, 'stages': {}, 'webdriver_calls': 0, 'gauges': {}})
+    
+    def add_stage(self, stage, duration, page=None):
+        """累计某个阶段的耗时，page为主机名称时同时计入该页面"""
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + duration
+            if page is not None:
+                page_stages = self._page(page)['stages']
+                page_stages[stage] = page_stages.get(stage, 0.0) + duration
+    
+    def count_call(self, method, page=None):
+        with self.lock:
+            self.webdriver_calls[method] = self.webdriver_calls.get(method, 0) + 1
+            if page is not None:
+                self._page(page)['webdriver_calls'] += 1
+    
+    def record_gauge(self, page, gauge, ok, text):
+        with self.lock:
+            self._page(page)['gauges'][gauge] = {'ok': ok, 'text': text}
+    
+    def record_samples(self, page, gauge, stats):
+        with self.lock:
+            self._page(page)['gauges'].setdefault(gauge, {})['samples'] = stats
+    
+    def set_page_status(self, page, status):
+        with self.lock:
+            self._page(page)['status'] = status
+    
+    def to_dict(self):
+        with self.lock:
+            gauge_results = [gauge['ok'] for page in self.pages.values() for gauge in page['gauges'].values()]
+            return {
+                'started_at': self.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+                'total_seconds': round(time.perf_counter() - self.start, 3),
+                'stages': {stage: round(duration, 3) for stage, duration in self.stages.items()},
+                'webdriver_calls': dict(self.webdriver_calls, total=sum(self.webdriver_calls.values())),
+                'gauges_ok': sum(gauge_results),
+                'gauges_failed': len(gauge_results) - sum(gauge_results),
+                'pages': {
+                    label: dict(page, stages={stage: round(duration, 3) for stage, duration in page['stages'].items()})
+                    for label, page in self.pages.items()
+                },
+                'alerts': list(self.alerts),
+            }
+    
+    def save(self, folder):
+        """将报告保存为日期文件夹中的JSON文件，返回文件路径"""
+        path = os.path.join(folder, f"运行报告_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            logger.info(f"运行报告已保存: {path}")
+        except OSError as e:
+            logger.error(f"保存运行报告失败: {str(e)}")
+        return path
+
+# 当前运行的报告，以及当前线程正在处理的页面（用于把耗时和调用次数归到对应主机）
+_active_report = None
+# 进程启动到入口开始执行的耗时，只计入进程内第一次运行的报告
+_startup_seconds = None
+# 当前运行使用的截图库，未启用时为None
+_active_image_store = None
+# 当前运行使用的仪表盘定位缓存
+_active_locator = None
+_page_context = threading.local()
+
+def current_page_label():
+    return getattr(_page_context, 'label', None)
+
+@contextmanager
+def log_phase(phase, stage=None):
+    """记录某个阶段的耗时，指定stage时同时计入运行报告"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        logger.info(f"[耗时] {phase}: {duration:.2f}s")
+        if stage and _active_report is not None:
+            _active_report.add_stage(stage, duration, current_page_label())
+
+def require(*names):
+    """导入DEPENDENCY_MODULES中的重量级依赖，首次导入的耗时计入运行报告的imports阶段"""
+    for name in names:
+        modules = [module for module in DEPENDENCY_MODULES[name] if module not in sys.modules]
+        if not modules:
+            continue
+        with log_phase(f"导入{name}", "imports"):
+            for module in modules:
+                importlib.import_module(module)
+
+class InstrumentedDriver:
+    """WebDriver代理，统计每次与浏览器的往返调用并计入运行报告；
+    find_element(s) 返回的元素同样经过代理，元素上的点击、输入等操作也计入"""
+    
+    # 读取时会向浏览器发请求的属性
+    ROUND_TRIP_PROPERTIES = ('current_url', 'title', 'page_source')
+    # 调用次数统计中的名称前缀，用于区分浏览器级和元素级的命令
+    CALL_PREFIX = ''
+    
+    def __init__(self, driver, report):
+        self._driver = driver
+        self._report = report
+    
+    def _wrap(self, name, result):
+        if name == 'find_element':
+            return InstrumentedElement(result, self._report)
+        if name == 'find_elements':
+            return [InstrumentedElement(element, self._report) for element in result]
+        return result
+    
+    def __getattr__(self, name):
+        attr = getattr(self._driver, name)
+        if name in self.ROUND_TRIP_PROPERTIES:
+            self._report.count_call(self.CALL_PREFIX + name, current_page_label())
+            return attr
+        if callable(attr) and not name.startswith('_'):
+            def counted(*args, **kwargs):
+                self._report.count_call(self.CALL_PREFIX + name, current_page_label())
+                return self._wrap(name, attr(*args, **kwargs))
+            return counted
+        return attr
+
+class InstrumentedElement(InstrumentedDriver):
+    """WebElement代理，元素上的每次操作都是一次浏览器往返"""
+    
+    ROUND_TRIP_PROPERTIES = ('text', 'tag_name', 'size', 'location', 'rect')
+    CALL_PREFIX = 'element.'
+
+def wait_for_dashboard_ready(driver, timeout=None):
+    """等待Zabbix仪表盘小部件渲染完成，就绪后立即返回；超时返回False"""
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    if timeout is None:
+        timeout = PAGE_READY_TIMEOUT
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=READY_POLL_INTERVAL).until(
+            lambda d: d.execute_script(DASHBOARD_READY_SCRIPT)
+        )
+        logger.info("仪表盘渲染完成")
+        return True
+    except TimeoutException:
+        logger.warning(f"等待仪表盘渲染超时（{timeout}s），继续尝试提取数据")
+        return False
+
+class InventoryError(Exception):
+    """主机清单格式错误"""
+
+def _validate_gauges(gauges, where):
+    if not isinstance(gauges, list) or not gauges:
+        raise InventoryError(f"{where} 的 gauges 必须是非空列表")
+    names = set()
+    for i, gauge in enumerate(gauges):
+        gauge_where = f"{where} 的第{i+1}个仪表盘"
+        if not isinstance(gauge, dict):
+            raise InventoryError(f"{gauge_where} 必须是对象")
+        if not isinstance(gauge.get('name'), str) or not gauge['name']:
+            raise InventoryError(f"{gauge_where} 缺少 name")
+        if gauge['name'] in names:
+            raise InventoryError(f"{gauge_where} 名称重复: {gauge['name']}")
+        names.add(gauge['name'])
+        if 'header' in gauge and (not isinstance(gauge['header'], str) or not gauge['header']):
+            raise InventoryError(f"{gauge_where} 的 header 必须是非空字符串")
+        if ('index' in gauge or 'header' not in gauge) and (not isinstance(gauge.get('index'), int) or gauge['index'] < 0):
+            raise InventoryError(f"{gauge_where} 的 index 必须是非负整数（配置了 header 时可省略）")
+        if not isinstance(gauge.get('column'), str) or not re.match(r'^[A-Z]{1,3}$', gauge['column']):
+            raise InventoryError(f"{gauge_where} 的 column 必须是Excel列字母，例如 H")
+        if 'stats_column' in gauge and (not isinstance(gauge['stats_column'], str) or not re.match(r'^[A-Z]{1,3}$', gauge['stats_column'])):
+            raise InventoryError(f"{gauge_where} 的 stats_column 必须是Excel列字母，例如 K")
+        for key in ('prefix', 'item_key'):
+            if key in gauge and not isinstance(gauge[key], str):
+                raise InventoryError(f"{gauge_where} 的 {key} 必须是字符串")
+        for key in ('threshold', 'max_delta'):
+            if key in gauge and (isinstance(gauge[key], bool) or not isinstance(gauge[key], (int, float))):
+                raise InventoryError(f"{gauge_where} 的 {key} 必须是数字")
+
+def _validate_server(server, where):
+    """校验一个Zabbix服务器配置并补齐默认账户"""
+    if not isinstance(server, dict) or not isinstance(server.get('url'), str) or not server['url']:
+        raise InventoryError(f"{where} 缺少 url")
+    server['url'] = server['url'].rstrip('/')
+    server.setdefault('username', 'guest')
+    server.setdefault('password', '')
+    for key in ('username', 'password', 'api_url', 'api_token'):
+        if key in server and not isinstance(server[key], str):
+            raise InventoryError(f"{where} 的 {key} 必须是字符串")
+    if 'dashboard_id' in server and not isinstance(server['dashboard_id'], int):
+        raise InventoryError(f"{where} 的 dashboard_id 必须是整数")
+
+# 只有顶层 server 时，它在 servers 中的名称
+DEFAULT_SERVER_NAME = "default"
+
+def load_inventory(path=None):
+    """读取并校验主机清单，格式错误时抛出InventoryError"""
+    if path is None:
+        path = INVENTORY_PATH
+    try:
+        with open(path, encoding='utf-8') as f:
+            inventory = json.load(f)
+    except OSError as e:
+        raise InventoryError(f"无法读取主机清单 {path}: {e}")
+    except ValueError as e:
+        raise InventoryError(f"主机清单 {path} 不是有效的JSON: {e}")
+    
+    if not isinstance(inventory, dict):
+        raise InventoryError("主机清单顶层必须是对象")
+    # 多个Zabbix前端写在 servers 中，主机通过 server 字段引用；顶层 server 为未指定时使用的默认服务器
+    servers = inventory.get('servers', {})
+    if not isinstance(servers, dict):
+        raise InventoryError("servers 必须是以名称为键的对象")
+    for name, server in servers.items():
+        _validate_server(server, f"服务器 {name}")
+    if 'server' in inventory:
+        _validate_server(inventory['server'], "server")
+        if DEFAULT_SERVER_NAME in servers:
+            raise InventoryError(f"servers 中的名称 {DEFAULT_SERVER_NAME} 与顶层 server 冲突")
+        servers[DEFAULT_SERVER_NAME] = inventory['server']
+    if not servers:
+        raise InventoryError("主机清单缺少 server.url")
+    inventory['servers'] = servers
+    if 'dashboard_id' in inventory and not isinstance(inventory['dashboard_id'], int):
+        raise InventoryError("dashboard_id 必须是整数")
+    if 'gauges' in inventory:
+        _validate_gauges(inventory['gauges'], "全局配置")
+    
+    hosts = inventory.get('hosts')
+    if not isinstance(hosts, list) or not hosts:
+        raise InventoryError("主机清单的 hosts 必须是非空列表")
+    labels = set()
+    rows = set()
+    for i, host in enumerate(hosts):
+        where = f"第{i+1}台主机"
+        if not isinstance(host, dict):
+            raise InventoryError(f"{where} 必须是对象")
+        label = host.get('label')
+        if not isinstance(label, str) or not label:
+            raise InventoryError(f"{where} 缺少 label")
+        where = f"{where}（{label}）"
+        if label in labels:
+            raise InventoryError(f"{where} 的 label 重复")
+        labels.add(label)
+        for key in ('page', 'row'):
+            if not isinstance(host.get(key), int) or host[key] < 1:
+                raise InventoryError(f"{where} 的 {key} 必须是正整数")
+        if host['row'] in rows:
+            raise InventoryError(f"{where} 的 row 与其他主机重复: {host['row']}")
+        rows.add(host['row'])
+        server_name = host.get('server', DEFAULT_SERVER_NAME)
+        if not isinstance(server_name, str):
+            raise InventoryError(f"{where} 的 server 必须是服务器名称")
+        if server_name not in servers:
+            raise InventoryError(f"{where} 引用的服务器不存在: {server_name}")
+        dashboard_id = host.get('dashboard_id', servers[server_name].get('dashboard_id', inventory.get('dashboard_id')))
+        if not isinstance(dashboard_id, int):
+            raise InventoryError(f"{where} 缺少 dashboard_id，且未配置服务器或全局 dashboard_id")
+        if 'host' in host and not isinstance(host['host'], str):
+            raise InventoryError(f"{where} 的 host 必须是字符串")
+        if 'gauges' in host:
+            _validate_gauges(host['gauges'], where)
+        elif 'gauges' not in inventory:
+            raise InventoryError(f"{where} 缺少 gauges，且未配置全局 gauges")
+    
+    logger.info(f"主机清单加载完成: {path}，共 {len(hosts)} 台主机")
+    return inventory
+
+def build_pages(inventory, today, date_folder):
+    """根据主机清单生成待处理页面列表，每个页面带有URL、截图文件名、Excel行号和仪表盘配置"""
+    pages = []
+    for i, host in enumerate(inventory['hosts']):
+        server_name = host.get('server', DEFAULT_SERVER_NAME)
+        server = inventory['servers'][server_name]
+        dashboard_id = host.get('dashboard_id', server.get('dashboard_id', inventory.get('dashboard_id')))
+        pages.append({
+            'page_num': i + 1,
+            'label': host['label'],
+            'server': server_name,
+            'host': host.get('host', host['label']),
+            'url': f"{server['url']}/zabbix.php?action=dashboard.view&dashboardid={dashboard_id}&page={host['page']}",
+            'filename': os.path.join(date_folder, f"{today}_{host['label']}.PNG"),
+            'row': host['row'],
+            'gauges': host.get('gauges', inventory.get('gauges')),
+        })
+    return pages
+
+def page_columns(page):
+    """按Excel列分组页面的仪表盘配置，同一列中的多个仪表盘按清单顺序换行拼接"""
+    columns = {}
+    for gauge in page['gauges']:
+        columns.setdefault(gauge['column'], []).append(gauge)
+    return columns
+
+def page_cells(page):
+    """页面对应的所有Excel单元格地址"""
+    return [f"{column}{page['row']}" for column in page_columns(page)]
+
+def date_folder_path(date_str):
+    """日期对应的文件夹路径，例如20250828 -> 当前目录下的08-28"""
     # 提取月日部分，例如20250828 -> 08-28
     month = date_str[4:6]  # 取MM部分
     day = date_str[6:8]    # 取DD部分
     folder_name = f"{month}-{day}"  # 格式化为MM-DD
-    folder_path = os.path.join(os.getcwd(), folder_name)
+    return os.path.join(os.getcwd(), folder_name)
+
+def create_date_folder(date_str, copy_template=True):
+    """创建以日期命名的文件夹，copy_template为True时复制日常检查表模板到其中"""
+    folder_path = date_folder_path(date_str)
     
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
         logger.info(f"创建文件夹: {folder_path}")
     else:
         logger.info(f"文件夹已存在: {folder_path}")
+    if not copy_template:
+        return folder_path
     # 新增：复制当前目录下的“日常检查表.xlsx”到日期文件夹
     try:
         src_excel = os.path.join(os.getcwd(), "日常检查表.xlsx")
@@ -55,288 +491,675 @@ def create_date_folder(date_str):
         logger.error(f"详细错误信息: {traceback.format_exc()}")    
     return folder_path
 
-def extract_svg_data_for_j_column(driver, page_num):
-    """从第一个和第二个SVG中提取特定class的文本内容，用于J列"""
-    logger.info(f"开始从第{page_num}个页面提取SVG数据用于J列")
+# 在浏览器内一次性读取页面上所有仪表盘的数值及所在小部件的标题，避免逐个元素的WebDriver往返
+# 返回 [{index, header, text, value, units}]，index为SVG序号，与 find_elements(By.TAG_NAME, "svg") 的顺序一致
+GAUGE_EXTRACT_SCRIPT = """
+var result = [];
+var svgs = document.getElementsByTagName('svg');
+for (var i = 0; i < svgs.length; i++) {
+    var nodes = svgs[i].getElementsByClassName('svg-gauge-value-and-units');
+    for (var j = 0; j < nodes.length; j++) {
+        var node = nodes[j];
+        var cls = String(node.className.baseVal || node.className);
+        if (cls.indexOf('svg-gauge-value-and-units-horizontal') === -1) {
+            continue;
+        }
+        var text = (node.textContent || '').replace(/\\s+/g, ' ').trim();
+        if (!text) {
+            continue;
+        }
+        var valueNode = node.querySelector('.svg-gauge-value');
+        var unitsNode = node.querySelector('.svg-gauge-units');
+        var widget = svgs[i].closest ? svgs[i].closest('.dashboard-grid-widget') : null;
+        var header = widget ? widget.querySelector('h4') : null;
+        result.push({
+            index: i,
+            header: header ? (header.textContent || '').replace(/\\s+/g, ' ').trim() : '',
+            text: text,
+            value: valueNode ? valueNode.textContent.trim() : null,
+            units: unitsNode ? unitsNode.textContent.trim() : null
+        });
+        break;
+    }
+}
+return result;
+"""
+
+def extract_gauge_values(driver):
+    """单次脚本调用提取页面上所有仪表盘数据，返回按SVG序号排列的 [{'index', 'header', 'text', 'value', 'units'}]"""
+    raw_result = driver.execute_script(GAUGE_EXTRACT_SCRIPT) or []
+    gauges = []
+    for item in raw_result:
+        text = item.get('text') or ''
+        value = item.get('value')
+        units = item.get('units')
+        # 仪表盘未拆分数值和单位时，从文本中解析
+        if value is None:
+            match = re.match(r'^(-?[\d.,]+)\s*(.*)$', text)
+            if match:
+                value, units = match.group(1), match.group(2)
+        gauges.append({
+            'index': int(item['index']),
+            'header': item.get('header') or '',
+            'text': text,
+            'value': value,
+            'units': units or '',
+        })
+    summary = {gauge['header'] or gauge['index']: gauge['text'] for gauge in gauges}
+    logger.info(f"单次提取到 {len(gauges)} 个仪表盘数据: {summary}")
+    return gauges
+
+class GaugeLocator:
+    """把清单中的仪表盘对应到页面上的小部件：优先使用缓存的小部件标题，缓存失效时按 header 或 index 重新定位"""
     
-    cpan1 = None
-    dpan1 = None
+    def __init__(self, path=None):
+        self.path = path or LOCATOR_CACHE_PATH
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.cache = json.load(f)
+        except FileNotFoundError:
+            self.cache = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取仪表盘定位缓存失败，重新定位: {str(e)}")
+            self.cache = {}
+        self.dirty = False
+        self.lock = threading.Lock()
     
-    try:
-        # 等待页面加载
-        time.sleep(2)
-        
-        # 查找所有SVG元素
-        svg_elements = driver.find_elements(By.TAG_NAME, "svg")
-        logger.info(f"找到 {len(svg_elements)} 个SVG元素")
-        
-        # 从第一个SVG中提取数据
-        if len(svg_elements) >= 1:
-            svg_element = svg_elements[0]  # 第一个SVG
-            logger.info("正在查找第一个SVG中的特定class元素")
-            
-            try:
-                target_elements = svg_element.find_elements(By.CLASS_NAME, "svg-gauge-value-and-units")
-                logger.info(f"在第一个SVG中找到 {len(target_elements)} 个svg-gauge-value-and-units元素")
-                
-                for element in target_elements:
-                    try:
-                        # 使用更安全的方式获取class属性
-                        class_attr = driver.execute_script("return arguments[0].className.baseVal || arguments[0].className;", element)
-                        if "svg-gauge-value-and-units-horizontal" in str(class_attr):
-                            text_content = element.text.strip()
-                            cpan1 = f"C:\\{text_content}"
-                            logger.info(f"从第一个SVG提取到数据: {cpan1}")
-                            break
-                    except Exception as attr_e:
-                        logger.warning(f"获取第一个SVG元素属性时出错: {str(attr_e)}")
-                        continue
-                        
-            except Exception as e:
-                logger.error(f"处理第一个SVG时出错: {str(e)}")
-        
-        # 从第二个SVG中提取数据
-        if len(svg_elements) >= 2:
-            svg_element = svg_elements[1]  # 第二个SVG
-            logger.info("正在查找第二个SVG中的特定class元素")
-            
+    @staticmethod
+    def _unique(readings, matches):
+        found = [reading for reading in readings if matches(reading)]
+        return found[0] if len(found) == 1 else None
+    
+    def locate(self, page, readings):
+        """返回 {仪表盘名称: 读数}，找不到的仪表盘不在结果中"""
+        with self.lock:
+            cached = self.cache.get(page['url'], {})
+        located = {}
+        updates = {}
+        for gauge in page['gauges']:
+            header = cached.get(gauge['name'])
+            reading = None
+            if header:
+                reading = self._unique(readings, lambda r: r['header'] == header)
+            if reading is None and gauge.get('header'):
+                reading = self._unique(readings, lambda r: gauge['header'] in r['header'])
+            if reading is None and header:
+                # 缓存的标题已找不到且清单中的 header 无法确认时，同一位置上可能已是其他小部件，不按位置取值，缓存保持不变
+                logger.warning(f"{page['label']} {gauge['name']} 缓存的小部件“{header}”已找不到，需要重新定位："
+                               f"请在清单中配置 header 或删除定位缓存中的该项")
+                continue
+            if reading is None and 'index' in gauge:
+                reading = self._unique(readings, lambda r: r['index'] == gauge['index'])
+            if reading is None:
+                continue
+            located[gauge['name']] = reading
+            # 标题在页面上唯一时才记入缓存
+            if reading['header'] and reading['header'] != header and \
+                    self._unique(readings, lambda r: r['header'] == reading['header']) is not None:
+                updates[gauge['name']] = reading['header']
+        if updates:
+            logger.info(f"{page['label']} 更新仪表盘定位: {updates}")
+            with self.lock:
+                self.cache.setdefault(page['url'], {}).update(updates)
+                self.dirty = True
+        return located
+    
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
             try:
-                target_elements = svg_element.find_elements(By.CLASS_NAME, "svg-gauge-value-and-units")
-                logger.info(f"在第二个SVG中找到 {len(target_elements)} 个svg-gauge-value-and-units元素")
-                
-                for element in target_elements:
-                    try:
-                        # 使用更安全的方式获取class属性
-                        class_attr = driver.execute_script("return arguments[0].className.baseVal || arguments[0].className;", element)
-                        if "svg-gauge-value-and-units-horizontal" in str(class_attr):
-                            text_content = element.text.strip()
-                            dpan1 = f"D:\\{text_content}"
-                            logger.info(f"从第二个SVG提取到数据: {dpan1}")
-                            break
-                    except Exception as attr_e:
-                        logger.warning(f"获取第二个SVG元素属性时出错: {str(attr_e)}")
-                        continue
-                        
-            except Exception as e:
-                logger.error(f"处理第二个SVG时出错: {str(e)}")
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(self.cache, f, ensure_ascii=False, indent=2)
+                self.dirty = False
+                logger.info(f"仪表盘定位缓存已保存: {self.path}")
+            except OSError as e:
+                logger.warning(f"保存仪表盘定位缓存失败: {str(e)}")
+
+class ExcelResultCollector:
+    """在内存中汇总所有页面的单元格结果，运行结束时一次性写入Excel。
+    指定template时从模板加载工作簿，写入后整体替换excel_file"""
+    
+    def __init__(self, excel_file, template=None):
+        self.excel_file = excel_file
+        self.template = template
+        self.cells = {}
+        # 解析后的数值型指标，运行结束时追加到历史指标库；同一次运行的指标使用同一时间戳
+        self.metrics = []
+        self.run_ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 并发模式下多个浏览器工作线程会同时记录结果
+        self.lock = threading.Lock()
+    
+    def record(self, values):
+        """记录一组单元格结果，values为 {单元格地址: 内容}"""
+        with self.lock:
+            self.cells.update(values)
+        for cell_address, value in values.items():
+            logger.info(f"已记录 {cell_address} 单元格: {value}")
+    
+    def record_metric(self, host, gauge, value, unit):
+        """记录一个解析后的仪表盘数值"""
+        with self.lock:
+            self.metrics.append({
+                'ts': self.run_ts,
+                'host': host,
+                'gauge': gauge,
+                'value': value,
+                'unit': unit,
+            })
+    
+    def has(self, cell_address):
+        """是否已记录某个单元格"""
+        with self.lock:
+            return cell_address in self.cells
+    
+    def commit(self):
+        """加载一次工作簿写入所有结果，先保存到临时文件再替换，避免中途崩溃留下损坏的工作簿"""
+        if not self.cells:
+            logger.warning("没有需要写入Excel的数据")
+            return False
+        source = self.template or self.excel_file
+        if not os.path.exists(source):
+            logger.error(f"Excel文件 {source} 不存在")
+            return False
         
-        # 如果没有提取到数据，设置默认值
-        if not cpan1:
-            cpan1 = f"C:\\页面{page_num}SVG1数据提取失败"
-            logger.warning(f"第{page_num}个页面第一个SVG未能提取到数据")
+        logger.info(f"开始将 {len(self.cells)} 个单元格写入Excel: {self.excel_file}")
+        from openpyxl import load_workbook
+        temp_path = None
+        try:
+            workbook = load_workbook(source)
+            worksheet = workbook.active
+            for cell_address, value in self.cells.items():
+                # 合并单元格中非左上角的单元格不可写，跳过并记录，避免整个工作簿写入失败
+                try:
+                    worksheet[cell_address] = value
+                except AttributeError:
+                    logger.error(f"单元格 {cell_address} 位于合并区域内，无法写入: {value}")
             
-        if not dpan1:
-            dpan1 = f"D:\\页面{page_num}SVG2数据提取失败"
-            logger.warning(f"第{page_num}个页面第二个SVG未能提取到数据")
-        
-        # 组合数据
-        combined_data = f"{cpan1}\n{dpan1}"
-        logger.info(f"组合后的数据: {combined_data}")
-        
-        return combined_data
+            fd, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=os.path.dirname(self.excel_file))
+            os.close(fd)
+            workbook.save(temp_path)
+            os.replace(temp_path, self.excel_file)
+            temp_path = None
+            logger.info(f"数据已成功保存到Excel: {self.excel_file}")
+            return True
+        except Exception as excel_e:
+            logger.error(f"保存到Excel时出错: {str(excel_e)}")
+            logger.error(f"详细错误信息: {traceback.format_exc()}")
+            return False
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+class StreamingResultWriter:
+    """按主机逐行写出结果，与ExcelResultCollector接口一致；每条记录到达时立即写出，不在内存中保留工作簿"""
+    
+    HEADER = ['运行时间', '记录时间', '主机', '行号']
+    
+    def __init__(self, folder, pages, fmt="csv"):
+        self.fmt = fmt
+        # 单元格行号对应的主机，以及所有页面用到的列
+        self.labels = {page['row']: page['label'] for page in pages}
+        self.columns = sorted({column for page in pages for gauge in page['gauges']
+                               for column in (gauge['column'], gauge.get('stats_column')) if column},
+                              key=lambda c: (len(c), c))
+        self.recorded = set()
+        self.metrics = []
+        self.run_ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.lock = threading.Lock()
+        header = self.HEADER + self.columns
         
-    except Exception as e:
-        logger.error(f"提取SVG数据时发生错误: {str(e)}")
-        return f"C:\\提取失败\nD:\\提取失败"
+        if fmt == "csv":
+            # 同一天多次运行追加到同一个文件，列不一致时另起一个文件
+            self.path = os.path.join(folder, "检查结果.csv")
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, encoding='utf-8-sig', newline='') as f:
+                    existing = next(csv.reader(f), [])
+                if existing != header:
+                    self.path = os.path.join(folder, f"检查结果_{datetime.now().strftime('%H%M%S')}.csv")
+            try:
+                self._open_csv(header)
+            except OSError as e:
+                # 检查结果.csv 在Excel中打开时会被锁定，本次运行另起一个文件
+                fallback = os.path.join(folder, f"检查结果_{datetime.now().strftime('%H%M%S')}.csv")
+                if self.path == fallback:
+                    raise
+                logger.warning(f"无法写入 {self.path}（{str(e)}），改为写入 {fallback}")
+                self.path = fallback
+                self._open_csv(header)
+        elif fmt == "xlsx":
+            from openpyxl import Workbook
+            self.path = os.path.join(folder, f"检查结果_{datetime.now().strftime('%H%M%S')}.xlsx")
+            self.workbook = Workbook(write_only=True)
+            self.worksheet = self.workbook.create_sheet("检查结果")
+            self.worksheet.append(header)
+        else:
+            raise ValueError(f"不支持的输出方式: {fmt}")
+        logger.info(f"结果将逐行写入: {self.path}")
+    
+    def _open_csv(self, header):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        # 新文件带BOM，方便Excel直接打开
+        self.file = open(self.path, 'a', encoding='utf-8-sig' if new_file else 'utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(header)
+            self.file.flush()
+    
+    def record(self, values):
+        """按行号把单元格结果合并成每台主机一行写出，values为 {单元格地址: 内容}"""
+        rows = {}
+        for cell_address, value in values.items():
+            match = re.match(r'^([A-Z]+)(\d+)$', cell_address)
+            if match:
+                rows.setdefault(int(match.group(2)), {})[match.group(1)] = value
+            logger.info(f"已记录 {cell_address} 单元格: {value}")
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            for row, cells in rows.items():
+                line = [self.run_ts, now, self.labels.get(row, ''), row] + [cells.get(column, '') for column in self.columns]
+                if self.fmt == "csv":
+                    self.writer.writerow(line)
+                    self.file.flush()
+                else:
+                    self.worksheet.append(line)
+                self.recorded.update(f"{column}{row}" for column in cells)
+    
+    def record_metric(self, host, gauge, value, unit):
+        with self.lock:
+            self.metrics.append({'ts': self.run_ts, 'host': host, 'gauge': gauge, 'value': value, 'unit': unit})
+    
+    def has(self, cell_address):
+        with self.lock:
+            return cell_address in self.recorded
+    
+    def commit(self):
+        """关闭结果文件；xlsx先保存到临时文件再替换"""
+        with self.lock:
+            if self.fmt == "csv":
+                self.file.close()
+                logger.info(f"结果已写入: {self.path}")
+                return True
+            temp_path = None
+            try:
+                fd, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=os.path.dirname(self.path))
+                os.close(fd)
+                self.workbook.save(temp_path)
+                os.replace(temp_path, self.path)
+                temp_path = None
+                logger.info(f"结果已写入: {self.path}")
+                return True
+            except Exception as excel_e:
+                logger.error(f"保存结果文件时出错: {str(excel_e)}")
+                logger.error(f"详细错误信息: {traceback.format_exc()}")
+                return False
+            finally:
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
 
-def extract_data_to_excel(driver, cell_address_h, cell_address_i, cell_address_j, page_num, date_folder):
-    # 提取网页数据并保存到Excel文件
-    logger.info(f"开始提取第{page_num}个页面的数据到单元格 {cell_address_h}, {cell_address_i}, {cell_address_j}")
+def read_stream_results(path):
+    """读取流式结果文件（csv或xlsx），逐行返回 {表头: 值}"""
+    if path.endswith(".csv"):
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            for record in csv.DictReader(f):
+                yield record
+        return
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name) for name in next(rows, [])]
+        for row in rows:
+            yield {name: ('' if value is None else value) for name, value in zip(header, row)}
+    finally:
+        workbook.close()
+
+def render_workbook(today, force=False):
+    """从某天的流式结果文件生成格式化的日常检查表，同一主机取最后一次记录。
+    日期文件夹中已有日常检查表时只写入结果单元格，保留其中其他内容；force为True时从模板重新生成"""
+    date_folder = date_folder_path(today)
+    paths = []
+    if os.path.isdir(date_folder):
+        paths = [os.path.join(date_folder, name) for name in sorted(os.listdir(date_folder))
+                 if name.startswith("检查结果") and name.endswith((".csv", ".xlsx"))]
+    records = [record for path in paths for record in read_stream_results(path)]
+    if not records:
+        logger.error(f"{date_folder} 中没有流式结果文件")
+        return False
+    
+    latest = {}
+    for record in sorted(records, key=lambda r: str(r['记录时间'])):
+        latest[int(record['行号'])] = record
+    cells = {}
+    for row, record in latest.items():
+        for name, value in record.items():
+            if name not in StreamingResultWriter.HEADER and value != '':
+                cells[f"{name}{row}"] = value
+    
+    src_excel = os.path.join(os.getcwd(), "日常检查表.xlsx")
+    dst_excel = os.path.join(date_folder, "日常检查表.xlsx")
+    if os.path.exists(dst_excel) and not force:
+        logger.info(f"{dst_excel} 已存在，结果写入该文件；需要从模板重新生成时使用 --force")
+        collector = ExcelResultCollector(dst_excel)
+    elif not os.path.exists(src_excel):
+        logger.error(f"源Excel不存在: {src_excel}")
+        return False
+    else:
+        collector = ExcelResultCollector(dst_excel, template=src_excel)
+    collector.record(cells)
+    return collector.commit()
+
+def extract_data_to_excel(driver, page, collector):
+    # 提取网页数据并记录到结果收集器，由收集器在运行结束时统一写入Excel；返回是否所有仪表盘都提取成功
+    page_num = page['page_num']
+    logger.info(f"开始提取第{page_num}个页面的数据到单元格 {', '.join(page_cells(page))}")
     
     try:
         # 记录当前页面URL
         current_url = driver.current_url
         logger.info(f"当前页面URL: {current_url}")
         
-        # 等待页面加载
-        logger.info("等待页面加载完成...")
-        time.sleep(2)
-        
-        # 检查页面是否加载完成
-        try:
-            WebDriverWait(driver, 10).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
-            )
-            logger.info("页面加载状态: 完成")
-        except TimeoutException:
-            logger.warning("页面加载超时，但继续尝试提取数据")
-        
         # 记录页面标题
         page_title = driver.title
         logger.info(f"页面标题: {page_title}")
         
-        data_value_svg3 = None
-        data_value_svg5 = None
-        
+        gauges = {}
         try:
-            # 查找SVG相关元素
-            logger.info("查找SVG相关元素")
-            svg_elements = driver.find_elements(By.TAG_NAME, "svg")
-            logger.info(f"找到 {len(svg_elements)} 个SVG元素")
-            
-            # 查找第3个SVG元素
-            if len(svg_elements) >= 3:
-                svg_element = svg_elements[2]  # 第3个SVG（索引为2）
-                logger.info("正在查找第3个SVG中的特定class元素")
-                
-                try:
-                    # 在第3个SVG内查找class为svg-gauge-value-and-units svg-gauge-value-and-units-horizontal的元素
-                    target_elements = svg_element.find_elements(By.CLASS_NAME, "svg-gauge-value-and-units")
-                    logger.info(f"在第3个SVG中找到 {len(target_elements)} 个svg-gauge-value-and-units元素")
-                    
-                    # 进一步筛选包含svg-gauge-value-and-units-horizontal class的元素
-                    for element in target_elements:
-                        try:
-                            # 使用更安全的方式获取class属性
-                            class_attr = driver.execute_script("return arguments[0].className.baseVal || arguments[0].className;", element)
-                            if "svg-gauge-value-and-units-horizontal" in str(class_attr):
-                                data_value_svg3 = element.text.strip()
-                                logger.info(f"找到SVG3目标元素，class: {class_attr}")
-                                logger.info(f"SVG3目标元素文本内容: '{data_value_svg3}'")
-                                break
-                        except Exception as attr_e:
-                            logger.warning(f"获取SVG3元素属性时出错: {str(attr_e)}")
-                            continue
-                    
-                    if data_value_svg3:
-                        logger.info(f"成功从SVG3提取到数据: {data_value_svg3}")
-                    else:
-                        logger.warning("未找到SVG3中包含svg-gauge-value-and-units-horizontal class的元素或元素文本为空")
-                        
-                except Exception as svg_e:
-                    logger.error(f"处理第3个SVG时出错: {str(svg_e)}")
-                    logger.error(f"详细错误信息: {traceback.format_exc()}")
-            else:
-                logger.warning(f"页面中SVG元素数量不足，只找到 {len(svg_elements)} 个，需要至少3个")
-            
-            # 查找第5个SVG元素
-            if len(svg_elements) >= 5:
-                svg_element = svg_elements[4]  # 第5个SVG（索引为4）
-                logger.info("正在查找第5个SVG中的特定class元素")
-                
-                try:
-                    # 在第5个SVG内查找class为svg-gauge-value-and-units svg-gauge-value-and-units-horizontal的元素
-                    target_elements = svg_element.find_elements(By.CLASS_NAME, "svg-gauge-value-and-units")
-                    logger.info(f"在第5个SVG中找到 {len(target_elements)} 个svg-gauge-value-and-units元素")
-                    
-                    # 进一步筛选包含svg-gauge-value-and-units-horizontal class的元素
-                    for element in target_elements:
-                        try:
-                            # 使用更安全的方式获取class属性
-                            class_attr = driver.execute_script("return arguments[0].className.baseVal || arguments[0].className;", element)
-                            if "svg-gauge-value-and-units-horizontal" in str(class_attr):
-                                data_value_svg5 = element.text.strip()
-                                logger.info(f"找到SVG5目标元素，class: {class_attr}")
-                                logger.info(f"SVG5目标元素文本内容: '{data_value_svg5}'")
-                                break
-                        except Exception as attr_e:
-                            logger.warning(f"获取SVG5元素属性时出错: {str(attr_e)}")
-                            continue
-                    
-                    if data_value_svg5:
-                        logger.info(f"成功从SVG5提取到数据: {data_value_svg5}")
-                    else:
-                        logger.warning("未找到SVG5中包含svg-gauge-value-and-units-horizontal class的元素或元素文本为空")
-                        
-                except Exception as svg_e:
-                    logger.error(f"处理第5个SVG时出错: {str(svg_e)}")
-                    logger.error(f"详细错误信息: {traceback.format_exc()}")
-            else:
-                logger.warning(f"页面中SVG元素数量不足，只找到 {len(svg_elements)} 个，需要至少5个")
-                        
+            # 一次性提取页面上所有仪表盘数据，各列均从该结果中取值
+            with log_phase(f"第{page_num}个页面SVG数据提取", "extract"):
+                readings = extract_gauge_values(driver)
+                locator = _active_locator or GaugeLocator()
+                gauges = locator.locate(page, readings)
         except Exception as e:
             logger.error(f"SVG查找失败: {str(e)}")
             logger.error(f"详细错误信息: {traceback.format_exc()}")
         
-        # 提取J列数据（新功能）
-        j_column_data = extract_svg_data_for_j_column(driver, page_num)
-        
-        # 如果没有数据，设置默认值
-        if not data_value_svg3:
-            logger.warning(f"第{page_num}个页面SVG3未能提取到数据")
-            data_value_svg3 = f"页面{page_num}SVG3数据提取失败 - {datetime.now().strftime('%H:%M:%S')}"
-        
-        if not data_value_svg5:
-            logger.warning(f"第{page_num}个页面SVG5未能提取到数据")
-            data_value_svg5 = f"页面{page_num}SVG5数据提取失败 - {datetime.now().strftime('%H:%M:%S')}"
+        samples = None
+        if SAMPLE_COUNT > 1 and gauges:
+            with log_phase(f"第{page_num}个页面采样", "sampling"):
+                samples = sample_gauges(driver, page, locator, gauges)
         
-        # 保存数据到Excel
-        logger.info(f"准备将数据保存到Excel单元格 {cell_address_h}, {cell_address_i}, {cell_address_j}")
-        excel_file = os.path.join(date_folder, "日常检查表.xlsx")
-        if os.path.exists(excel_file):
-            try:
-                workbook = load_workbook(excel_file)
-                worksheet = workbook.active
-                worksheet[cell_address_h] = data_value_svg3
-                worksheet[cell_address_i] = data_value_svg5
-                worksheet[cell_address_j] = j_column_data  # 新功能：保存J列数据
-                workbook.save(excel_file)
-                logger.info(f"数据已成功保存到 {cell_address_h} 单元格: {data_value_svg3}")
-                logger.info(f"数据已成功保存到 {cell_address_i} 单元格: {data_value_svg5}")
-                logger.info(f"数据已成功保存到 {cell_address_j} 单元格: {j_column_data}")
-            except Exception as excel_e:
-                logger.error(f"保存到Excel时出错: {str(excel_e)}")
-                logger.error(f"详细错误信息: {traceback.format_exc()}")
-        else:
-            logger.error(f"Excel文件 {excel_file} 不存在")
+        return record_gauge_results(gauges, page, collector, samples)
             
     except Exception as e:
         logger.error(f"提取数据时发生严重错误: {str(e)}")
         logger.error(f"详细错误信息: {traceback.format_exc()}")
         
-        # 即使出错也要保存错误信息到Excel
+        # 即使出错也要记录错误信息，随其他结果一起写入Excel
+        record_page_failure(collector, page, e, force=True)
+        return False
+
+def sample_stats(values):
+    """一组采样值的统计：次数、最小、平均、最大和P95（最近秩法）"""
+    ordered = sorted(values)
+    count = len(ordered)
+    return {
+        'count': count,
+        'min': ordered[0],
+        'avg': round(sum(ordered) / count, 3),
+        'max': ordered[-1],
+        'p95': ordered[max(1, math.ceil(count * 0.95)) - 1],
+    }
+
+def sample_gauges(driver, page, locator, first):
+    """页面不刷新，在采样窗口内再读取 SAMPLE_COUNT-1 次仪表盘数值，返回 {仪表盘名称: 统计}，first为第一次读数"""
+    series = {}
+    units = {}
+    
+    def add(located):
+        for name, reading in located.items():
+            value, unit = parse_gauge_result(reading)
+            if value is not None:
+                series.setdefault(name, []).append(value)
+                units.setdefault(name, unit)
+    
+    add(first)
+    interval = SAMPLE_WINDOW / (SAMPLE_COUNT - 1)
+    next_read = time.monotonic()
+    for _ in range(SAMPLE_COUNT - 1):
+        next_read += interval
+        time.sleep(max(0.0, next_read - time.monotonic()))
         try:
-            excel_file = os.path.join(date_folder, "日常检查表.xlsx")
-            if os.path.exists(excel_file):
-                workbook = load_workbook(excel_file)
-                worksheet = workbook.active
-                worksheet[cell_address_h] = f"提取失败: {str(e)[:50]}"
-                worksheet[cell_address_i] = f"提取失败: {str(e)[:50]}"
-                worksheet[cell_address_j] = f"C:\\提取失败\nD:\\提取失败"
-                workbook.save(excel_file)
-                logger.info(f"错误信息已保存到Excel单元格 {cell_address_h}, {cell_address_i}, {cell_address_j}")
-        except Exception as excel_error:
-            logger.error(f"保存错误信息到Excel失败: {str(excel_error)}")
+            add(locator.locate(page, extract_gauge_values(driver)))
+        except Exception as e:
+            logger.warning(f"第{page['page_num']}个页面采样中断: {str(e)}")
+            break
+    
+    samples = {name: dict(sample_stats(values), unit=units[name]) for name, values in series.items()}
+    logger.info(f"第{page['page_num']}个页面采样结果: {samples}")
+    return samples
 
-def take_screenshots():
-    logger.info("开始执行网页截图和数据提取任务")
+def format_sample_stats(stats):
+    # 与单元格中的数值格式一致，数值和单位之间留一个空格
+    unit = f" {stats['unit']}" if stats['unit'] else ''
+    return f"最小{stats['min']:g}{unit} 平均{stats['avg']:g}{unit} 最大{stats['max']:g}{unit} P95 {stats['p95']:g}{unit}（{stats['count']}次）"
+
+def record_gauge_results(gauges, page, collector, samples=None):
+    """按清单中的列配置格式化仪表盘提取结果并记录到结果收集器，gauges为 {仪表盘名称: 读数}，
+    samples为采样统计时一并记录到运行报告和 stats_column 列；返回是否所有仪表盘都有数据"""
+    page_num = page['page_num']
+    values = {}
+    complete = True
+    for column, column_gauges in page_columns(page).items():
+        parts = []
+        for gauge in column_gauges:
+            source = f"SVG{gauge['index'] + 1}" if 'index' in gauge else gauge['name']
+            prefix = gauge.get('prefix', '')
+            result = gauges.get(gauge['name'])
+            if result and result['text']:
+                logger.info(f"成功从{source}提取到{gauge['name']}数据: {result['text']}")
+                parts.append(f"{prefix}{result['text']}")
+                value, unit = parse_gauge_result(result)
+                if value is not None:
+                    collector.record_metric(page['label'], gauge['name'], value, unit)
+            else:
+                # 如果没有数据，设置默认值
+                logger.warning(f"第{page_num}个页面{source}（{gauge['name']}）未能提取到数据")
+                failure_text = f"{prefix}页面{page_num}{source}数据提取失败"
+                if not prefix:
+                    failure_text += f" - {datetime.now().strftime('%H:%M:%S')}"
+                parts.append(failure_text)
+                complete = False
+            if _active_report is not None:
+                _active_report.record_gauge(page['label'], gauge['name'], bool(result and result['text']), parts[-1])
+        values[f"{column}{page['row']}"] = "\n".join(parts)
     
-    # 获取当前日期
-    today = datetime.now().strftime("%Y%m%d")
-    logger.info(f"当前日期: {today}")
+    # 采样统计写入运行报告和统计列，同一列的多个仪表盘按顺序换行拼接
+    if samples:
+        stats_parts = {}
+        for gauge in page['gauges']:
+            stats = samples.get(gauge['name'])
+            if stats is None:
+                continue
+            if _active_report is not None:
+                _active_report.record_samples(page['label'], gauge['name'], stats)
+            if gauge.get('stats_column'):
+                stats_parts.setdefault(f"{gauge['stats_column']}{page['row']}", []).append(
+                    f"{gauge.get('prefix', '')}{format_sample_stats(stats)}")
+        values.update({cell: "\n".join(parts) for cell, parts in stats_parts.items()})
     
-    # 创建日期文件夹
-    date_folder = create_date_folder(today)
-    logger.info(f"图片将保存到文件夹: {date_folder}")
+    # 记录到结果收集器
+    collector.record(values)
+    return complete
+
+class ZabbixAPIError(Exception):
+    """Zabbix API返回错误"""
+
+class ZabbixAPIClient:
+    """Zabbix JSON-RPC客户端，所有请求复用同一个HTTP长连接"""
+    
+    def __init__(self, api_url, token="", timeout=15):
+        parts = urllib.parse.urlsplit(api_url)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.path = parts.path or "/api_jsonrpc.php"
+        self.timeout = timeout
+        self.auth = token or None
+        self.version = None
+        self.request_id = 0
+        self.connection = None
+    
+    def _connect(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+    
+    def _post(self, body, headers):
+        # 长连接被服务器关闭时重新建立连接并重试一次
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self._connect()
+            try:
+                self.connection.request("POST", self.path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt == 1:
+                    raise
+    
+    def call(self, method, params):
+        """调用一个API方法，返回result字段"""
+        self.request_id += 1
+        payload = {"jsonrpc": "2.0", "method": method, "params": params, "id": self.request_id}
+        headers = {"Content-Type": "application/json-rpc"}
+        if self.auth and method not in ("apiinfo.version", "user.login"):
+            # Zabbix 6.4起推荐使用Authorization头，旧版本只认auth字段
+            if self.version and self.version >= (6, 4):
+                headers["Authorization"] = f"Bearer {self.auth}"
+            else:
+                payload["auth"] = self.auth
+        
+        status, body = self._post(json.dumps(payload).encode("utf-8"), headers)
+        if status != 200:
+            raise ZabbixAPIError(f"{method} HTTP状态码 {status}")
+        data = json.loads(body.decode("utf-8"))
+        if "error" in data:
+            error = data["error"]
+            raise ZabbixAPIError(f"{method} 调用失败: {error.get('message')} {error.get('data')}")
+        return data["result"]
+    
+    def login(self, username="guest", password=""):
+        """获取API版本，未配置API令牌时用账户密码登录"""
+        version = self.call("apiinfo.version", {})
+        self.version = tuple(int(part) for part in version.split(".")[:2])
+        logger.info(f"Zabbix API版本: {version}")
+        if self.auth:
+            return
+        # Zabbix 5.4起登录参数由user改为username
+        user_field = "username" if self.version >= (5, 4) else "user"
+        self.auth = self.call("user.login", {user_field: username, "password": password})
+        logger.info("Zabbix API登录成功")
+    
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+def format_gauge_value(value, units):
+    """按仪表盘的显示方式格式化监控项数值，例如 45.23 %"""
+    try:
+        text = f"{float(value):.2f}"
+    except (TypeError, ValueError):
+        text = str(value)
+    return f"{text} {units}".strip()
+
+def collect_gauges_via_api(client, hostnames, item_keys):
+    """通过少量批量请求获取所有主机的监控项最新值，返回 {主机名: {监控项键值: {'text', 'value', 'units'}}}"""
+    hosts = client.call("host.get", {
+        "output": ["hostid", "host", "name"],
+        "filter": {"host": hostnames},
+    })
+    # 主机名未匹配时再按可见名称查找
+    found = {host['host'] for host in hosts}
+    missing = [name for name in hostnames if name not in found]
+    if missing:
+        hosts += client.call("host.get", {
+            "output": ["hostid", "host", "name"],
+            "filter": {"name": missing},
+        })
+    hostid_to_name = {}
+    for host in hosts:
+        hostid_to_name[host['hostid']] = host['host'] if host['host'] in hostnames else host['name']
+    logger.info(f"API匹配到 {len(hostid_to_name)}/{len(hostnames)} 台主机")
+    if not hostid_to_name or not item_keys:
+        return {}
     
-    # 网页URL列表
-    urls = [
-        "http://192.168.166.108/zabbix.php?action=dashboard.view&dashboardid=392&page=2",
-        "http://192.168.166.108/zabbix.php?action=dashboard.view&dashboardid=392&page=3",
-        "http://192.168.166.108/zabbix.php?action=dashboard.view&dashboardid=392&page=4",
-        "http://192.168.166.108/zabbix.php?action=dashboard.view&dashboardid=392&page=5"
-    ]
-    
-    # 截图文件名列表（包含文件夹路径）
-    filenames = [
-        os.path.join(date_folder, f"{today}_WMS1.PNG"),
-        os.path.join(date_folder, f"{today}_WMS2.PNG"),
-        os.path.join(date_folder, f"{today}_QZPMS.PNG"),
-        os.path.join(date_folder, f"{today}_QNPMS.PNG")
-    ]
-    
-    # Excel单元格地址列表
-    excel_cells_h = ["H4", "H5", "H6", "H7"]
-    excel_cells_i = ["I4", "I5", "I6", "I7"]
-    excel_cells_j = ["J4", "J5", "J6", "J7"]  # 新增J列单元格
-    
-    # 设置Edge浏览器
-    edge_driver_path = os.path.join(os.getcwd(), "msedgedriver.exe")
+    items = client.call("item.get", {
+        "output": ["itemid", "hostid", "key_", "lastvalue", "lastclock", "units", "value_type"],
+        "hostids": list(hostid_to_name),
+        "filter": {"key_": list(item_keys)},
+    })
+    
+    # 没有最新值的监控项按值类型分组，从最近一小时的历史数据中补取
+    stale_items = [item for item in items if item.get('lastclock', '0') == '0']
+    latest_history = {}
+    by_value_type = {}
+    for item in stale_items:
+        by_value_type.setdefault(item['value_type'], []).append(item['itemid'])
+    for value_type, itemids in by_value_type.items():
+        history = client.call("history.get", {
+            "output": ["itemid", "clock", "value"],
+            "history": int(value_type),
+            "itemids": itemids,
+            "time_from": int(time.time()) - 3600,
+            "sortfield": "clock",
+            "sortorder": "DESC",
+        })
+        for record in history:
+            latest_history.setdefault(record['itemid'], record['value'])
+    
+    results = {name: {} for name in hostid_to_name.values()}
+    for item in items:
+        if item.get('lastclock', '0') != '0':
+            value = item['lastvalue']
+        else:
+            value = latest_history.get(item['itemid'])
+        if value is None:
+            continue
+        results[hostid_to_name[item['hostid']]][item['key_']] = {
+            'text': format_gauge_value(value, item.get('units', '')),
+            'value': value,
+            'units': item.get('units', ''),
+        }
+    return results
+
+def collect_pages_via_api(name, server, pages, collector):
+    """API采集模式：一次性获取所有页面对应主机的指标并记录到结果收集器，失败时返回False。
+    环境变量中的API地址和令牌只用于默认服务器"""
+    is_default = name == DEFAULT_SERVER_NAME
+    api_url = server.get('api_url') or (ZABBIX_API_URL if is_default else '') or f"{server['url']}/api_jsonrpc.php"
+    client = ZabbixAPIClient(api_url, server.get('api_token') or (ZABBIX_API_TOKEN if is_default else ''))
+    item_keys = sorted({gauge['item_key'] for page in pages for gauge in page['gauges'] if gauge.get('item_key')})
+    try:
+        with log_phase("API指标采集", "api_collect"):
+            client.login(server['username'], server['password'])
+            values_by_host = collect_gauges_via_api(client, sorted({page['host'] for page in pages}), item_keys)
+    except Exception as e:
+        logger.error(f"通过API采集指标失败: {str(e)}")
+        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        return False
+    finally:
+        client.close()
+    
+    for page in pages:
+        # 按清单将监控项键值映射回仪表盘序号，与浏览器提取结果格式一致
+        values = values_by_host.get(page['host'], {})
+        gauges = {gauge['name']: values[gauge['item_key']] for gauge in page['gauges'] if gauge.get('item_key') in values}
+        logger.info(f"第{page['page_num']}个页面（主机 {page['host']}）API数据: {gauges}")
+        record_gauge_results(gauges, page, collector)
+    return True
+
+def create_edge_driver():
+    """启动无头Edge浏览器，驱动文件不存在时返回None"""
+    from selenium import webdriver
+    from selenium.webdriver.edge.service import Service
+    edge_driver_path = EDGE_DRIVER_PATH or os.path.join(os.getcwd(), "msedgedriver.exe")
     logger.info(f"Edge驱动路径: {edge_driver_path}")
     
     if not os.path.exists(edge_driver_path):
         logger.error(f"Edge驱动文件不存在: {edge_driver_path}")
-        return
+        return None
     
     service = Service(edge_driver_path)
     
@@ -355,183 +1178,1382 @@ def take_screenshots():
     
     logger.info("浏览器选项配置完成")
     
-    try:
-        # 启动浏览器
-        logger.info("正在启动Edge浏览器...")
+    # 启动浏览器
+    logger.info("正在启动Edge浏览器...")
+    with log_phase("浏览器启动", "browser_startup"):
         driver = webdriver.Edge(service=service, options=options)
-        logger.info("Edge浏览器启动成功")
-        
-        wait = WebDriverWait(driver, 15)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    logger.info("Edge浏览器启动成功")
+    if _active_report is not None:
+        return InstrumentedDriver(driver, _active_report)
+    return driver
+
+def login_zabbix(driver, server):
+    """通过登录表单登录Zabbix，失败时记录错误并继续"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    wait = WebDriverWait(driver, PAGE_READY_TIMEOUT, poll_frequency=READY_POLL_INTERVAL)
+    
+    # 先访问登录页面
+    login_url = server['url']
+    logger.info(f"访问登录页面: {login_url}")
+    
+    try:
+        # 查找用户名输入框，出现即说明登录页面已加载
+        logger.info("查找用户名输入框...")
+        with log_phase("登录页面加载", "login"):
+            driver.get(login_url)
+            username_field = wait.until(EC.presence_of_element_located((By.NAME, "name")))
+        logger.info("登录页面加载完成")
+        username_field.clear()
+        username_field.send_keys(server['username'])
+        logger.info("用户名输入完成")
         
-        # 先访问登录页面
-        login_url = "http://192.168.166.108"
-        logger.info(f"访问登录页面: {login_url}")
-        driver.get(login_url)
+        # 查找密码输入框
+        logger.info("查找密码输入框...")
+        password_field = driver.find_element(By.NAME, "password")
+        password_field.clear()
+        password_field.send_keys(server['password'])  # guest账户密码通常为空
+        logger.info("密码输入完成")
         
-        # 等待登录页面加载
-        time.sleep(2)
-        logger.info("登录页面加载完成")
+        # 点击登录按钮，登录表单被替换即说明登录请求已完成
+        logger.info("点击登录按钮...")
+        login_button = driver.find_element(By.NAME, "enter")
+        with log_phase("登录提交", "login"):
+            login_button.click()
+            wait.until(EC.staleness_of(login_button))
+        logger.info("登录流程完成")
+        return True
         
+    except Exception as login_error:
+        logger.error(f"登录过程中出现错误: {str(login_error)}")
+        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        logger.info("尝试直接访问页面...")
+        return False
+
+# 同一服务器的多个浏览器工作线程共用会话缓存，同一时间只允许一个线程验证或登录；不同服务器互不等待
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+# 会话缓存文件由所有服务器共用，读改写需要串行
+_session_cache_lock = threading.Lock()
+
+def session_lock(server):
+    with _session_locks_guard:
+        return _session_locks.setdefault(server['url'], threading.Lock())
+
+def load_session_cookies(server):
+    """读取某个Zabbix地址缓存的会话Cookie，没有缓存时返回空列表"""
+    try:
+        with open(SESSION_CACHE_PATH, encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache.get(server['url'], {}).get('cookies', [])
+    except (OSError, ValueError):
+        return []
+
+def save_session_cookies(server, cookies):
+    """保存登录后的会话Cookie，按Zabbix地址区分"""
+    with _session_cache_lock:
         try:
-            # 查找用户名输入框
-            logger.info("查找用户名输入框...")
-            username_field = wait.until(EC.presence_of_element_located((By.NAME, "name")))
-            username_field.clear()
-            username_field.send_keys("guest")
-            logger.info("用户名输入完成")
-            
-            # 查找密码输入框
-            logger.info("查找密码输入框...")
-            password_field = driver.find_element(By.NAME, "password")
-            password_field.clear()
-            password_field.send_keys("")  # guest账户密码通常为空
-            logger.info("密码输入完成")
-            
-            # 点击登录按钮
-            logger.info("点击登录按钮...")
-            login_button = driver.find_element(By.NAME, "enter")
-            login_button.click()
-            
-            # 等待登录完成
-            time.sleep(2)
-            logger.info("登录流程完成")
-            
-        except Exception as login_error:
-            logger.error(f"登录过程中出现错误: {str(login_error)}")
-            logger.error(f"详细错误信息: {traceback.format_exc()}")
-            logger.info("尝试直接访问页面...")
-        
-        # 依次访问每个网页，先提取数据再截图
-        for i, (url, filename, cell_h, cell_i, cell_j) in enumerate(zip(urls, filenames, excel_cells_h, excel_cells_i, excel_cells_j)):
-            logger.info(f"\n{'='*50}")
-            logger.info(f"开始处理第{i+1}个网页")
-            logger.info(f"URL: {url}")
-            logger.info(f"文件名: {filename}")
-            logger.info(f"Excel单元格: {cell_h}, {cell_i}, {cell_j}")
-            logger.info(f"{'='*50}")
-            
-            try:
-                # 访问网页
-                logger.info(f"正在访问网页...")
-                driver.get(url)
-                
-                # 等待页面加载完成
-                time.sleep(2)
-                logger.info("页面访问完成")
-                
-                # 先提取数据到Excel（写入日期文件夹中的副本）
-                logger.info("开始数据提取...")
-                extract_data_to_excel(driver, cell_h, cell_i, cell_j, i+1, date_folder)
-                
-                # 再进行截图
-                logger.info("开始截图...")
-                
-                # 先截取整个页面到临时文件
-                temp_filename = f"temp_{i}.png"
-                driver.save_screenshot(temp_filename)
-                logger.info(f"临时截图保存: {temp_filename}")
-                
-                # 使用PIL裁剪指定区域
-                img = Image.open(temp_filename)
-                cropped = img.crop((180, 120, 1850, 870))
-                cropped.save(filename)
-                logger.info(f"裁剪后截图保存: {filename}")
-                
-                # 删除临时文件
-                os.remove(temp_filename)
-                logger.info("临时文件已删除")
-                
-                # 等待一下再访问下一个网页
-                time.sleep(2)
-                
-            except Exception as page_error:
-                logger.error(f"处理第{i+1}个网页时出错: {str(page_error)}")
-                logger.error(f"详细错误信息: {traceback.format_exc()}")
-                continue
+            with open(SESSION_CACHE_PATH, encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        cache[server['url']] = {
+            'saved_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'cookies': [{key: cookie[key] for key in SESSION_COOKIE_FIELDS if key in cookie} for cookie in cookies],
+        }
+        try:
+            with open(SESSION_CACHE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            logger.info(f"会话已缓存到: {SESSION_CACHE_PATH}")
+        except OSError as e:
+            logger.warning(f"保存会话缓存失败: {str(e)}")
+
+def restore_session(driver, server):
+    """写回缓存的会话Cookie并验证是否仍然有效，有效返回True"""
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import WebDriverException
+    cookies = load_session_cookies(server)
+    if not cookies:
+        return False
+    
+    try:
+        with log_phase("会话验证", "session_restore"):
+            # 必须先打开同一域名下的页面才能写入Cookie，静态图标是最轻量的页面
+            driver.get(f"{server['url']}/favicon.ico")
+            for cookie in cookies:
+                try:
+                    driver.add_cookie(cookie)
+                except WebDriverException as e:
+                    logger.warning(f"写入Cookie {cookie.get('name')} 失败: {str(e)}")
+            # 会话有效时首页会直接跳转到仪表盘，失效时显示登录表单
+            driver.get(f"{server['url']}/index.php")
+            valid = not driver.find_elements(By.NAME, "enter")
+    except WebDriverException as e:
+        logger.warning(f"验证缓存会话时出错: {str(e)}")
+        valid = False
+    
+    if valid:
+        logger.info("缓存的Zabbix会话有效，跳过表单登录")
+    else:
+        logger.info("缓存的Zabbix会话已失效，重新登录")
+    return valid
+
+def ensure_logged_in(driver, server):
+    """优先复用缓存的会话，失效时才通过登录表单登录并更新缓存"""
+    with session_lock(server):
+        if restore_session(driver, server):
+            return
+        if login_zabbix(driver, server):
+            save_session_cookies(server, driver.get_cookies())
+
+def record_page_failure(collector, page, error, force=False):
+    """页面未能提取到数据时记录失败标记，避免留下空白行；force为False时不覆盖已记录的结果"""
+    if not force and collector.has(page_cells(page)[0]):
+        return
+    values = {}
+    for column, column_gauges in page_columns(page).items():
+        if _active_report is not None:
+            for gauge in column_gauges:
+                _active_report.record_gauge(page['label'], gauge['name'], False, str(error)[:100])
+        if all(gauge.get('prefix') for gauge in column_gauges):
+            values[f"{column}{page['row']}"] = "\n".join(f"{gauge['prefix']}提取失败" for gauge in column_gauges)
+        else:
+            values[f"{column}{page['row']}"] = f"提取失败: {str(error)[:50]}"
+    collector.record(values)
+
+def capture_page_image(driver):
+    """在内存中截取仪表盘区域，返回裁剪后的PIL图像"""
+    from PIL import Image
+    left, top, right, bottom = SCREENSHOT_CROP_BOX
+    if SCREENSHOT_CLIP:
+        try:
+            result = driver.execute_cdp_cmd("Page.captureScreenshot", {
+                "format": "png",
+                "clip": {"x": left, "y": top, "width": right - left, "height": bottom - top, "scale": 1},
+            })
+            image = Image.open(io.BytesIO(base64.b64decode(result['data'])))
+            image.load()
+            if image.size == (right - left, bottom - top):
+                return image
+            logger.warning(f"区域截图尺寸 {image.size} 与裁剪区域不一致，改用整页截图裁剪")
+        except Exception as clip_error:
+            logger.warning(f"区域截图失败，改用整页截图裁剪: {str(clip_error)}")
+    
+    with Image.open(io.BytesIO(driver.get_screenshot_as_png())) as screenshot:
+        return screenshot.crop(SCREENSHOT_CROP_BOX)
+
+def process_page(driver, page, collector, extract=True, ready_timeout=None, capture=True):
+    """访问单个仪表盘页面，先提取数据再截图；extract为False时只截图，capture为False时只提取数据。
+    返回 (截图图像, 是否成功, 页面加载耗时)，未截图或截图失败时图像为None；提取数据时有数据缺失视为不成功，
+    所有仪表盘都已读到时即使等待就绪超时也视为成功，避免重试时较差的结果覆盖已写入的数据；只截图时未就绪视为不成功"""
+    page_num = page['page_num']
+    logger.info(f"\n{'='*50}")
+    logger.info(f"开始处理第{page_num}个网页")
+    logger.info(f"URL: {page['url']}")
+    logger.info(f"文件名: {page['filename']}")
+    logger.info(f"Excel单元格: {', '.join(page_cells(page))}")
+    logger.info(f"{'='*50}")
+    
+    # 本线程后续的耗时和WebDriver调用都计入该页面
+    _page_context.label = page['label']
+    page_start = time.perf_counter()
+    try:
+        # 访问网页并等待仪表盘渲染完成
+        logger.info(f"正在访问网页...")
+        load_start = time.perf_counter()
+        with log_phase(f"第{page_num}个页面加载", "page_load"):
+            driver.get(page['url'])
+            ready = wait_for_dashboard_ready(driver, ready_timeout)
+        load_seconds = time.perf_counter() - load_start
+        logger.info("页面访问完成")
         
-        logger.info("\n所有网页处理完成！")
+        # 先提取数据到结果收集器
+        complete = True
+        if extract:
+            logger.info("开始数据提取...")
+            complete = extract_data_to_excel(driver, page, collector)
+        
+        if extract:
+            ok = complete
+            if complete and not ready:
+                logger.warning(f"第{page_num}个页面等待就绪超时，但所有仪表盘都已提取到数据")
+        else:
+            ok = ready
+        if not capture:
+            if _active_report is not None:
+                _active_report.set_page_status(page['label'], 'ok' if ok else ('incomplete' if ready else 'not ready'))
+            return None, ok, load_seconds
+        
+        # 再进行截图，截图在内存中裁剪，只编码写盘一次
+        logger.info("开始截图...")
+        with log_phase(f"第{page_num}个页面截图", "screenshot"):
+            cropped = capture_page_image(driver)
+            if _active_image_store is not None:
+                saved_path = _active_image_store.put(page['label'], cropped)
+            else:
+                cropped.save(page['filename'])
+                saved_path = page['filename']
+        logger.info(f"裁剪后截图保存: {saved_path}")
+        if _active_report is not None:
+            _active_report.set_page_status(page['label'], 'ok' if ok else ('incomplete' if ready else 'not ready'))
+        return cropped, ok, load_seconds
         
-        # 合并四张图片
-        logger.info("开始合并图片...")
-        combine_images(filenames, today, date_folder)
+    except Exception as page_error:
+        logger.error(f"处理第{page_num}个网页时出错: {str(page_error)}")
+        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        record_page_failure(collector, page, page_error)
+        if _active_report is not None:
+            _active_report.set_page_status(page['label'], f"failed: {str(page_error)[:100]}")
+        return None, False, None
+    
+    finally:
+        if _active_report is not None:
+            _active_report.add_stage("page_total", time.perf_counter() - page_start, page['label'])
+        _page_context.label = None
+
+def load_page_load_times(path=None):
+    """读取各主机的历史页面加载耗时，文件不存在或损坏时返回空字典"""
+    path = path or LOAD_TIMES_PATH
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取页面耗时记录失败，使用默认超时: {str(e)}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+# 多个服务器的页面同时完成时，耗时记录文件的读改写需要串行
+_load_times_lock = threading.Lock()
+
+def save_page_load_times(load_times, path=None):
+    """把各主机的页面加载耗时合并写回记录文件，不影响其他主机的记录"""
+    path = path or LOAD_TIMES_PATH
+    with _load_times_lock:
+        merged = load_page_load_times(path)
+        merged.update(load_times)
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(merged, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"保存页面耗时记录失败: {str(e)}")
+
+class PageScheduler:
+    """给浏览器工作线程分配页面：失败的页面按有界退避排到队尾重试，
+    按各主机的历史加载耗时自适应设置就绪等待超时，并在运行截止时间到达后停止分配"""
+    
+    def __init__(self, pages, max_retries=None, deadline=None, load_times=None):
+        self.max_retries = PAGE_MAX_RETRIES if max_retries is None else max_retries
+        deadline = RUN_DEADLINE if deadline is None else deadline
+        self.deadline = time.monotonic() + deadline if deadline > 0 else None
+        self.load_times = load_times if load_times is not None else {}
+        # 待处理队列中的元素为 (页面, 已尝试次数, 最早可开始时间)
+        self.pending = [(page, 0, 0.0) for page in pages]
+        self.in_flight = 0
+        self.expired = False
+        self.cond = threading.Condition()
+    
+    def time_left(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+    
+    def ready_timeout(self, page, attempt):
+        """首次访问按该主机的历史耗时设置超时，重试时使用完整超时；都不超过剩余运行时间"""
+        timeout = PAGE_READY_TIMEOUT
+        history = self.load_times.get(page['label'])
+        if attempt == 0 and history:
+            adaptive = history['avg'] * ADAPTIVE_TIMEOUT_FACTOR + ADAPTIVE_TIMEOUT_MARGIN
+            timeout = min(PAGE_READY_TIMEOUT, max(ADAPTIVE_TIMEOUT_MIN, adaptive))
+        left = self.time_left()
+        if left is not None:
+            timeout = max(1.0, min(timeout, left))
+        return timeout
+    
+    def next(self):
+        """领取下一个可处理的页面，返回 (页面, 已尝试次数, 就绪超时)；没有剩余页面或已到截止时间时返回None"""
+        with self.cond:
+            while True:
+                left = self.time_left()
+                if left is not None and left <= 0:
+                    if not self.expired:
+                        self.expired = True
+                        logger.error("已到运行截止时间，不再处理剩余页面")
+                    self.cond.notify_all()
+                    return None
+                now = time.monotonic()
+                for i, (page, attempt, not_before) in enumerate(self.pending):
+                    if not_before <= now:
+                        del self.pending[i]
+                        self.in_flight += 1
+                        return page, attempt, self.ready_timeout(page, attempt)
+                if not self.pending and self.in_flight == 0:
+                    return None
+                # 剩余页面都在退避等待，或其他线程处理中的页面可能失败后重新入队
+                waits = [not_before - now for _, _, not_before in self.pending]
+                if left is not None:
+                    waits.append(left)
+                self.cond.wait(min(waits) if waits else None)
+    
+    def done(self, page, attempt, ok, load_seconds=None):
+        """报告页面处理结果，失败且还有重试次数和剩余时间时排到队尾重试，返回是否已重新入队"""
+        with self.cond:
+            self.in_flight -= 1
+            if ok and load_seconds is not None:
+                history = self.load_times.get(page['label'])
+                if history:
+                    avg = history['avg'] + LOAD_TIME_SMOOTHING * (load_seconds - history['avg'])
+                    self.load_times[page['label']] = {'avg': round(avg, 3), 'samples': history['samples'] + 1}
+                else:
+                    self.load_times[page['label']] = {'avg': round(load_seconds, 3), 'samples': 1}
+            
+            requeued = False
+            if not ok and attempt < self.max_retries:
+                backoff = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt)
+                left = self.time_left()
+                if left is None or left > backoff:
+                    self.pending.append((page, attempt + 1, time.monotonic() + backoff))
+                    requeued = True
+                    logger.warning(f"第{page['page_num']}个网页将在{backoff:.1f}s后进行第{attempt + 1}次重试")
+            self.cond.notify_all()
+            return requeued
+    
+    def abandon(self, item):
+        """工作线程无法继续时交还已领取的页面，留给其他线程处理"""
+        page, attempt, _ = item
+        with self.cond:
+            self.in_flight -= 1
+            self.pending.insert(0, (page, attempt, 0.0))
+            self.cond.notify_all()
+    
+    def drain(self):
+        """取出所有未处理的页面"""
+        with self.cond:
+            pages = [page for page, _, _ in self.pending]
+            self.pending = []
+            return pages
+
+def capture_worker(worker_id, server, scheduler, collector, compositor, extract=True, driver=None, capture=True):
+    """浏览器工作线程：启动并登录一次浏览器，复用同一会话依次处理调度器分配的页面，截图立即交给合成器。
+    传入driver时使用该常驻浏览器，结束后不关闭"""
+    owns_driver = driver is None
+    try:
+        if owns_driver:
+            driver = create_edge_driver()
+            if driver is None:
+                return
+        elif _active_report is not None:
+            driver = InstrumentedDriver(driver, _active_report)
+        ensure_logged_in(driver, server)
         
+        while True:
+            item = scheduler.next()
+            if item is None:
+                break
+            page, attempt, ready_timeout = item
+            retry_note = f"（第{attempt}次重试）" if attempt else ""
+            logger.info(f"工作线程{worker_id}领取第{page['page_num']}个网页{retry_note}，就绪超时{ready_timeout:.1f}s")
+            try:
+                image, ok, load_seconds = process_page(driver, page, collector, extract, ready_timeout, capture)
+            except BaseException:
+                scheduler.abandon(item)
+                raise
+            if image is not None and compositor is not None:
+                compositor.add(page['page_num'] - 1, image)
+            scheduler.done(page, attempt, ok, load_seconds)
+    
     except Exception as e:
-        logger.error(f"程序执行过程中发生严重错误: {str(e)}")
+        logger.error(f"工作线程{worker_id}执行过程中发生严重错误: {str(e)}")
         logger.error(f"详细错误信息: {traceback.format_exc()}")
     
     finally:
         # 关闭浏览器
-        if 'driver' in locals():
-            logger.info("正在关闭浏览器...")
+        if owns_driver and driver is not None:
+            logger.info(f"工作线程{worker_id}正在关闭浏览器...")
             driver.quit()
-            logger.info("浏览器已关闭")
+            logger.info(f"工作线程{worker_id}浏览器已关闭")
 
-def combine_images(filenames, today, date_folder):
-    """将四张图片合并为一张，并添加浅绿色分隔线"""
-    logger.info("开始合并图片")
+def capture_pages(pages, server, collector, compositor, concurrency=None, extract=True, drivers=None, capture=True):
+    """将页面分配给浏览器工作池处理，并发数为1时在当前线程中顺序执行；传入drivers时由这些常驻浏览器处理。
+    capture为False时只提取数据不截图，compositor可以为None"""
+    if drivers:
+        concurrency = len(drivers)
+    elif concurrency is None:
+        concurrency = CAPTURE_CONCURRENCY
+    worker_count = max(1, min(concurrency, len(pages)))
+    worker_drivers = list(drivers or [])[:worker_count] or [None] * worker_count
+    
+    scheduler = PageScheduler(pages, load_times=load_page_load_times())
     
+    if worker_count == 1:
+        logger.info("顺序模式：使用单个浏览器会话处理所有页面")
+        capture_worker(1, server, scheduler, collector, compositor, extract, worker_drivers[0], capture)
+    else:
+        logger.info(f"并发模式：使用 {worker_count} 个浏览器会话处理 {len(pages)} 个页面")
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="capture") as executor:
+            for worker_id, driver in enumerate(worker_drivers, 1):
+                executor.submit(capture_worker, worker_id, server, scheduler, collector, compositor, extract, driver, capture)
+    
+    labels = {page['label'] for page in pages}
+    save_page_load_times({label: times for label, times in scheduler.load_times.items() if label in labels})
+    
+    # 浏览器未能启动或已到截止时间导致未处理的页面同样记录失败标记
+    reason = "超过运行截止时间" if scheduler.expired else "浏览器会话不可用"
+    for page in scheduler.drain():
+        logger.error(f"第{page['page_num']}个网页未被处理: {reason}")
+        record_page_failure(collector, page, reason)
+        if _active_report is not None:
+            _active_report.set_page_status(page['label'], f"failed: {reason}")
+
+def run_server(name, server, pages, collector, compositor, drivers=None, capture=True):
+    """采集同一个Zabbix服务器上的页面：API模式先批量采集指标，再用浏览器截图或从页面提取"""
+    start = time.perf_counter()
     try:
-        # 打开四张图片
-        images = []
-        for filename in filenames:
-            if os.path.exists(filename):
-                img = Image.open(filename)
-                images.append(img)
-                logger.info(f"成功加载图片: {filename}")
-            else:
-                logger.error(f"图片文件不存在: {filename}")
-                return
+        # API模式先批量采集指标，浏览器只负责截图；API不可用时回退到从页面提取
+        extract_in_browser = True
+        if COLLECT_MODE == "api":
+            extract_in_browser = not collect_pages_via_api(name, server, pages, collector)
+            if extract_in_browser:
+                logger.warning(f"服务器 {name} API采集失败，回退到从仪表盘页面提取数据")
         
-        if len(images) != 4:
-            logger.error(f"图片数量不正确，需要4张，实际{len(images)}张")
-            return
+        # 只提取数据且API已采集成功时不需要启动浏览器
+        if capture or extract_in_browser:
+            require('selenium')
+            capture_pages(pages, server, collector, compositor,
+                          extract=extract_in_browser, drivers=drivers or None, capture=capture)
+    except Exception as e:
+        logger.error(f"采集服务器 {name} 时发生严重错误: {str(e)}")
+        logger.error(f"详细错误信息: {traceback.format_exc()}")
+    finally:
+        if _active_report is not None:
+            _active_report.add_stage(f"server:{name}", time.perf_counter() - start)
+
+def take_screenshots(drivers=None, capture=True):
+    """执行一次完整的截图和数据提取任务，返回本次运行的RunReport，主机清单无效时返回None。
+    drivers为常驻模式下已启动的浏览器，不传时本次运行自行启动和关闭浏览器；capture为False时只提取数据写入Excel"""
+    global _active_report, _active_image_store, _active_locator, _startup_seconds
+    logger.info("开始执行网页截图和数据提取任务" if capture else "开始执行数据提取任务（不截图）")
+    report = RunReport()
+    if _startup_seconds is not None:
+        report.add_stage("startup", _startup_seconds)
+        _startup_seconds = None
+    
+    # 启动时一次性读取并校验主机清单
+    try:
+        inventory = load_inventory()
+    except InventoryError as e:
+        logger.error(f"主机清单无效: {str(e)}")
+        return None
+    
+    # 获取当前日期
+    today = datetime.now().strftime("%Y%m%d")
+    logger.info(f"当前日期: {today}")
+    
+    output_mode = OUTPUT_MODE
+    if output_mode != "template" and output_mode not in STREAM_OUTPUT_MODES:
+        logger.error(f"不支持的输出方式 {output_mode}，使用日常检查表模板")
+        output_mode = "template"
+    
+    # 创建日期文件夹，流式输出时不复制模板
+    date_folder = create_date_folder(today, copy_template=output_mode == "template")
+    logger.info(f"图片将保存到文件夹: {date_folder}")
+    
+    # 根据主机清单生成页面列表
+    pages = build_pages(inventory, today, date_folder)
+    _active_report = report
+    _active_locator = GaugeLocator()
+    if capture and IMAGE_STORE_DIR:
+        try:
+            _active_image_store = ImageStore(IMAGE_STORE_DIR)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"打开截图库失败，截图保存到日期文件夹: {str(e)}")
+    
+    collector = None
+    compositor = None
+    try:
+        if output_mode == "template":
+            # 所有页面的结果先汇总在内存中，结束时一次性写入日期文件夹中的Excel副本
+            collector = ExcelResultCollector(os.path.join(date_folder, "日常检查表.xlsx"))
+        else:
+            # 结果到达时逐行写出
+            if output_mode == "xlsx":
+                require('openpyxl')
+            collector = StreamingResultWriter(date_folder, pages, output_mode)
         
-        # 获取图片尺寸
-        img_width, img_height = images[0].size
-        logger.info(f"图片尺寸: {img_width} x {img_height}")
+        if capture:
+            require('selenium', 'PIL')
+            # 截图到达时即粘贴到合并画布上
+            left, top, right, bottom = SCREENSHOT_CROP_BOX
+            compositor = GridCompositor([page['label'] for page in pages], (right - left, bottom - top))
         
-        # 分隔线宽度
-        separator_width = 10
+        # 按服务器分组，各服务器同时采集，总耗时取决于最慢的服务器
+        groups = {}
+        for page in pages:
+            groups.setdefault(page['server'], []).append(page)
+        if len(groups) == 1:
+            name, server_pages = next(iter(groups.items()))
+            run_server(name, inventory['servers'][name], server_pages, collector, compositor, drivers, capture)
+        else:
+            logger.info(f"同时采集 {len(groups)} 个Zabbix服务器: {', '.join(groups)}")
+            drivers = list(drivers or [])
+            with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="server") as executor:
+                futures = [
+                    # 常驻浏览器按服务器轮流分配，常驻模式按服务器数量准备浏览器，每个服务器各分到并发数个
+                    executor.submit(run_server, name, inventory['servers'][name], server_pages,
+                                    collector, compositor, drivers[i::len(groups)], capture)
+                    for i, (name, server_pages) in enumerate(groups.items())
+                ]
+                for future in futures:
+                    future.result()
+        logger.info("\n所有网页处理完成！")
         
-        # 创建新的画布
-        combined_width = img_width * 2 + separator_width
-        combined_height = img_height * 2 + separator_width
-        combined_image = Image.new('RGB', (combined_width, combined_height), 'white')
-        logger.info(f"合并画布尺寸: {combined_width} x {combined_height}")
+        if compositor is not None:
+            # 补齐缺失主机的占位图并保存合并图片
+            logger.info("开始合并图片...")
+            with log_phase("图片合并", "composite"):
+                compositor.save(os.path.join(date_folder, f"{today}-机房.png"))
         
-        # 创建绘图对象
-        draw = ImageDraw.Draw(combined_image)
+    except Exception as e:
+        logger.error(f"程序执行过程中发生严重错误: {str(e)}")
+        logger.error(f"详细错误信息: {traceback.format_exc()}")
+    
+    finally:
+        # 一次性写入本次运行收集到的所有结果
+        if collector is not None:
+            if output_mode == "template":
+                require('openpyxl')
+            with log_phase("Excel写入", "excel_write"):
+                collector.commit()
+        
+        # 先与上次运行的数值比较生成告警，再把本次解析后的数值追加到历史指标库
+        if collector is not None and collector.metrics:
+            try:
+                alerts = None
+                try:
+                    with MetricsStore() as store:
+                        with log_phase("告警评估", "alerts"):
+                            alerts = evaluate_alerts(pages, collector.metrics, store)
+                        with log_phase("历史指标写入", "metrics_store"):
+                            store.append(collector.metrics, source="run")
+                except sqlite3.Error as e:
+                    logger.error(f"读写历史指标库失败: {str(e)}")
+                    if alerts is None:
+                        alerts = evaluate_alerts(pages, collector.metrics)
+                if alerts:
+                    publish_alerts(alerts, date_folder, report)
+            except Exception as e:
+                # 告警出错不能影响后面关闭截图库、保存定位缓存和运行报告
+                logger.error(f"告警处理失败: {str(e)}")
+                logger.error(f"详细错误信息: {traceback.format_exc()}")
         
-        # 浅绿色
-        light_green = (144, 238, 144)
+        if _active_image_store is not None:
+            _active_image_store.close()
+            _active_image_store = None
+        _active_locator.save()
+        _active_locator = None
         
-        # 粘贴图片到指定位置
-        combined_image.paste(images[0], (0, 0))  # 左上
-        combined_image.paste(images[1], (img_width + separator_width, 0))  # 右上
-        combined_image.paste(images[2], (0, img_height + separator_width))  # 左下
-        combined_image.paste(images[3], (img_width + separator_width, img_height + separator_width))  # 右下
+        # 输出本次运行的耗时报告
+        _active_report = None
+        report.save(date_folder)
+    
+    return report
+
+class GridCompositor:
+    """按网格布局合成任意数量的主机截图，每张截图到达时立即粘贴到画布上"""
+    
+    # 分隔线宽度和颜色（浅绿色）
+    SEPARATOR_WIDTH = 10
+    SEPARATOR_COLOR = (144, 238, 144)
+    PLACEHOLDER_COLOR = (220, 220, 220)
+    # 合并图的最大宽度，主机较多时按比例缩小每个格子，避免画布过大
+    MAX_WIDTH = 7000
+    
+    def __init__(self, labels, tile_size):
+        self.labels = list(labels)
+        count = max(1, len(self.labels))
+        # 尽量接近正方形：4台为2x2，5~6台为3x2，以此类推
+        self.columns = math.ceil(math.sqrt(count))
+        self.rows = math.ceil(count / self.columns)
         
-        # 绘制分隔线
-        draw.rectangle([
-            (img_width, 0),
-            (img_width + separator_width, combined_height)
-        ], fill=light_green)
+        tile_width, tile_height = tile_size
+        scale = min(1.0, (self.MAX_WIDTH - (self.columns - 1) * self.SEPARATOR_WIDTH) / (self.columns * tile_width))
+        self.tile_width = int(tile_width * scale)
+        self.tile_height = int(tile_height * scale)
         
-        draw.rectangle([
-            (0, img_height),
-            (combined_width, img_height + separator_width)
-        ], fill=light_green)
+        width = self.columns * self.tile_width + (self.columns - 1) * self.SEPARATOR_WIDTH
+        height = self.rows * self.tile_height + (self.rows - 1) * self.SEPARATOR_WIDTH
+        from PIL import Image
+        self.canvas = Image.new('RGB', (width, height), 'white')
+        self.filled = set()
+        self.lock = threading.Lock()
+        logger.info(f"合并画布尺寸: {width} x {height}（{self.columns}列 x {self.rows}行）")
+    
+    def tile_origin(self, slot):
+        row, column = divmod(slot, self.columns)
+        return (column * (self.tile_width + self.SEPARATOR_WIDTH),
+                row * (self.tile_height + self.SEPARATOR_WIDTH))
+    
+    def add(self, slot, image):
+        """将第slot个主机的截图粘贴到对应位置，尺寸不一致时缩放到格子大小"""
+        if image.size != (self.tile_width, self.tile_height):
+            image = image.resize((self.tile_width, self.tile_height))
+        with self.lock:
+            self.canvas.paste(image, self.tile_origin(slot))
+            self.filled.add(slot)
+    
+    def _placeholder_font(self):
+        # 优先使用中文字体，系统中没有时退回Pillow默认字体
+        from PIL import ImageFont
+        for font_name in ("msyh.ttc", "simhei.ttf"):
+            try:
+                return ImageFont.truetype(font_name, 48), True
+            except OSError:
+                continue
+        return ImageFont.load_default(), False
+    
+    def finish(self):
+        """为缺失的主机绘制占位图，绘制分隔线，返回合成后的画布"""
+        from PIL import ImageDraw
+        draw = ImageDraw.Draw(self.canvas)
+        missing = [slot for slot in range(len(self.labels)) if slot not in self.filled]
+        if missing:
+            font, supports_cjk = self._placeholder_font()
+            for slot in missing:
+                label = self.labels[slot]
+                logger.warning(f"{label} 缺少截图，使用占位图")
+                x, y = self.tile_origin(slot)
+                draw.rectangle([(x, y), (x + self.tile_width - 1, y + self.tile_height - 1)], fill=self.PLACEHOLDER_COLOR)
+                text = f"{label} 截图失败" if supports_cjk else f"{label} - capture failed"
+                draw.text((x + 40, y + 40), text, fill=(200, 0, 0), font=font)
+        
+        width, height = self.canvas.size
+        for column in range(1, self.columns):
+            x = column * (self.tile_width + self.SEPARATOR_WIDTH) - self.SEPARATOR_WIDTH
+            draw.rectangle([(x, 0), (x + self.SEPARATOR_WIDTH - 1, height - 1)], fill=self.SEPARATOR_COLOR)
+        for row in range(1, self.rows):
+            y = row * (self.tile_height + self.SEPARATOR_WIDTH) - self.SEPARATOR_WIDTH
+            draw.rectangle([(0, y), (width - 1, y + self.SEPARATOR_WIDTH - 1)], fill=self.SEPARATOR_COLOR)
+        return self.canvas
+    
+    def save(self, filename):
+        self.finish().save(filename)
+        logger.info(f"图片合并完成，已保存为: {filename}")
+
+def dhash(image, hash_size=16):
+    """计算图像的差值感知哈希：缩小为灰度图后比较相邻像素的明暗，返回整数哈希"""
+    from PIL import Image
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+def hash_distance(a, b):
+    return bin(a ^ b).count('1')
+
+def image_digest(image):
+    """图像像素内容的sha256摘要（包含模式和尺寸），像素完全相同的图像摘要相同"""
+    digest = hashlib.sha256(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode('ascii'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def pixels_match(a, b, tolerance):
+    """两张图像尺寸相同且每个像素各通道的差都不超过tolerance时返回True"""
+    from PIL import ImageChops
+    if a.size != b.size:
+        return False
+    difference = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    return max(high for _, high in difference.getextrema()) <= tolerance
+
+class ImageStore:
+    """按像素内容去重的截图库：图片以像素摘要命名存放，索引库记录每次截图对应的图片。
+    images.hash 为像素内容的sha256摘要，images.dhash 为用于查找近似图片的感知哈希"""
+    
+    # 查找近似图片时与该主机最近多少张不同的图片比较
+    RECENT_CANDIDATES = 50
+    
+    def __init__(self, root, max_distance=None, pixel_tolerance=None):
+        self.root = root
+        self.max_distance = IMAGE_HASH_DISTANCE if max_distance is None else max_distance
+        self.pixel_tolerance = IMAGE_PIXEL_TOLERANCE if pixel_tolerance is None else pixel_tolerance
+        os.makedirs(root, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(root, "索引.db"), check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                hash TEXT PRIMARY KEY,
+                dhash TEXT NOT NULL,
+                path TEXT NOT NULL,
+                first_seen TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS captures (
+                date TEXT NOT NULL,
+                host TEXT NOT NULL,
+                ts TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                distance INTEGER NOT NULL,
+                PRIMARY KEY (date, host, ts)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_captures_host ON captures (host, ts);
+        """)
+        self.lock = threading.Lock()
+    
+    def _find_similar(self, host, image, digest, image_hash):
+        """在已有图片中查找与image像素相同的一张；允许近似时再逐像素比较该主机最近的感知哈希相近的截图"""
+        row = self.connection.execute("SELECT hash, path FROM images WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            return row[0], row[1], 0
+        if self.max_distance <= 0:
+            return None
+        rows = self.connection.execute(
+            "SELECT i.hash, i.dhash, i.path, MAX(c.ts) AS last_ts FROM captures c JOIN images i ON i.hash = c.hash "
+            "WHERE c.host = ? GROUP BY i.hash ORDER BY last_ts DESC LIMIT ?",
+            (host, self.RECENT_CANDIDATES),
+        ).fetchall()
+        candidates = []
+        for candidate_digest, candidate_hash, path, _ in rows:
+            distance = hash_distance(image_hash, int(candidate_hash, 16))
+            if distance <= self.max_distance:
+                candidates.append((distance, candidate_digest, path))
+        from PIL import Image
+        for distance, candidate_digest, path in sorted(candidates):
+            full_path = os.path.join(self.root, path)
+            if not os.path.exists(full_path):
+                continue
+            with Image.open(full_path) as stored:
+                if pixels_match(image, stored, self.pixel_tolerance):
+                    return candidate_digest, path, distance
+        return None
+    
+    def put(self, host, image, when=None):
+        """保存一张主机截图，与已有图片像素相同或仅有细微差异时只记录引用；返回图片文件路径"""
+        when = when or datetime.now()
+        digest = image_digest(image)
+        image_hash = dhash(image)
+        with self.lock:
+            match = self._find_similar(host, image, digest, image_hash)
+            if match is not None:
+                key, relative_path, distance = match
+                logger.info(f"{host} 截图与已有图片相同或近似（距离{distance}），引用 {relative_path}")
+            else:
+                key = digest
+                relative_path = os.path.join(key[:2], f"{key}.png")
+                path = os.path.join(self.root, relative_path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                image.save(path)
+                distance = 0
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT INTO images (hash, dhash, path, first_seen) VALUES (?, ?, ?, ?)",
+                        (key, f"{image_hash:064x}", relative_path, when.strftime("%Y-%m-%d %H:%M:%S")),
+                    )
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO captures (date, host, ts, hash, distance) VALUES (?, ?, ?, ?, ?)",
+                    (when.strftime("%Y-%m-%d"), host, when.strftime("%Y-%m-%d %H:%M:%S"), key, distance),
+                )
+        return os.path.join(self.root, relative_path)
+    
+    def lookup(self, date, host):
+        """某天某主机最后一次截图的图片路径（date为 YYYY-mm-dd），没有时返回None"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT i.path FROM captures c JOIN images i ON i.hash = c.hash "
+                "WHERE c.date = ? AND c.host = ? ORDER BY c.ts DESC LIMIT 1",
+                (date, host),
+            ).fetchone()
+        return os.path.join(self.root, row[0]) if row else None
+    
+    def close(self):
+        self.connection.close()
+
+def combine_images(filenames, labels, today, date_folder):
+    """从磁盘读取各主机截图并按网格合并为一张，缺失的截图使用占位图"""
+    from PIL import Image
+    logger.info("开始合并图片")
+    
+    try:
+        left, top, right, bottom = SCREENSHOT_CROP_BOX
+        compositor = GridCompositor(labels, (right - left, bottom - top))
+        for slot, filename in enumerate(filenames):
+            if os.path.exists(filename):
+                with Image.open(filename) as img:
+                    compositor.add(slot, img)
+                logger.info(f"成功加载图片: {filename}")
+            else:
+                logger.error(f"图片文件不存在: {filename}")
         
         # 保存合并后的图片到日期文件夹
-        combined_filename = os.path.join(date_folder, f"{today}-机房.png")
-        combined_image.save(combined_filename)
-        logger.info(f"图片合并完成，已保存为: {combined_filename}")
+        with log_phase("图片合并", "composite"):
+            compositor.save(os.path.join(date_folder, f"{today}-机房.png"))
         
     except Exception as e:
         logger.error(f"合并图片时发生错误: {str(e)}")
         logger.error(f"详细错误信息: {traceback.format_exc()}")
 
+def combine_saved_images(today):
+    """按主机清单重新合并某天已保存的主机截图；启用截图库时，日期文件夹中没有的截图从库中查找"""
+    inventory = load_inventory()
+    date_folder = date_folder_path(today)
+    if not os.path.isdir(date_folder):
+        logger.error(f"日期文件夹不存在: {date_folder}")
+        return False
+    pages = build_pages(inventory, today, date_folder)
+    filenames = [page['filename'] for page in pages]
+    if IMAGE_STORE_DIR:
+        store = ImageStore(IMAGE_STORE_DIR)
+        try:
+            day = datetime.strptime(today, "%Y%m%d").strftime("%Y-%m-%d")
+            for i, page in enumerate(pages):
+                if not os.path.exists(filenames[i]):
+                    filenames[i] = store.lookup(day, page['label']) or filenames[i]
+        finally:
+            store.close()
+    combine_images(filenames, [page['label'] for page in pages], today, date_folder)
+    return True
+
+def parse_gauge_text(text):
+    """将仪表盘文本解析为 (数值, 单位)，例如 '45.23 %' -> (45.23, '%')；无法解析（如提取失败）时返回 (None, '')"""
+    match = re.match(r'^\s*(-?\d[\d,]*(?:\.\d+)?)\s*(.*?)\s*$', text or '')
+    if not match:
+        return None, ''
+    return float(match.group(1).replace(',', '')), match.group(2)
+
+def parse_gauge_result(result):
+    """从提取结果中取数值和单位，优先使用已拆分的数值字段"""
+    try:
+        return float(str(result.get('value')).replace(',', '')), result.get('units') or ''
+    except (TypeError, ValueError):
+        return parse_gauge_text(result.get('text'))
+
+class MetricsStore:
+    """基于SQLite的历史指标库，按 (主机, 仪表盘, 时间) 建立索引"""
+    
+    def __init__(self, path=None):
+        self.path = path or METRICS_DB_PATH
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                ts TEXT NOT NULL,
+                host TEXT NOT NULL,
+                gauge TEXT NOT NULL,
+                value REAL NOT NULL,
+                unit TEXT NOT NULL DEFAULT '',
+                source TEXT NOT NULL DEFAULT 'run',
+                PRIMARY KEY (host, gauge, ts)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_metrics_ts ON metrics (ts);
+        """)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def append(self, records, source="run"):
+        """追加一批指标记录，同一主机、仪表盘、时间的记录会被覆盖，返回写入条数"""
+        rows = [(r['ts'], r['host'], r['gauge'], r['value'], r.get('unit') or '', source) for r in records]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metrics (ts, host, gauge, value, unit, source) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        logger.info(f"已写入 {len(rows)} 条历史指标到 {self.path}")
+        return len(rows)
+    
+    def query(self, host=None, gauge=None, start=None, end=None):
+        """按主机、仪表盘和时间范围（'YYYY-mm-dd[ HH:MM:SS]'，含起止）查询，按时间升序返回"""
+        conditions = []
+        params = []
+        for column, value in (('host', host), ('gauge', gauge)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            conditions.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            # 只给日期时包含当天全天
+            conditions.append("ts <= ?")
+            params.append(end if len(end) > 10 else f"{end} 23:59:59")
+        sql = "SELECT ts, host, gauge, value, unit, source FROM metrics"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY ts"
+        return [dict(row) for row in self.connection.execute(sql, params)]
+    
+    def latest(self, host, gauge, before=None):
+        """某主机某仪表盘在指定时间之前的最近一条记录，没有时返回None"""
+        sql = "SELECT ts, host, gauge, value, unit, source FROM metrics WHERE host = ? AND gauge = ?"
+        params = [host, gauge]
+        if before is not None:
+            sql += " AND ts < ?"
+            params.append(before)
+        row = self.connection.execute(sql + " ORDER BY ts DESC LIMIT 1", params).fetchone()
+        return dict(row) if row else None
+    
+    def recorded_on(self, date):
+        """某天（'YYYY-mm-dd'）已有记录的 (主机, 仪表盘) 集合"""
+        rows = self.connection.execute(
+            "SELECT DISTINCT host, gauge FROM metrics WHERE ts >= ? AND ts <= ?", (date, f"{date} 23:59:59"))
+        return {(row['host'], row['gauge']) for row in rows}
+    
+    def trend(self, host, gauge, days=90):
+        """最近days天的数值序列及汇总（首末值、变化量、最小值、最大值）"""
+        start = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        rows = self.query(host=host, gauge=gauge, start=start)
+        summary = None
+        if rows:
+            values = [row['value'] for row in rows]
+            summary = {
+                'first': rows[0],
+                'last': rows[-1],
+                'change': round(values[-1] - values[0], 2),
+                'min': min(values),
+                'max': max(values),
+                'count': len(values),
+            }
+        return rows, summary
+    
+    def close(self):
+        self.connection.close()
+
+def evaluate_alerts(pages, metrics, store=None):
+    """按清单中的阈值和最大变化量检查本次数值，返回告警列表；store为None时只检查阈值"""
+    latest = {}
+    for metric in metrics:
+        # 重试的页面可能记录多次，以最后一次为准
+        latest[(metric['host'], metric['gauge'])] = metric
+    
+    alerts = []
+    for page in pages:
+        for gauge in page['gauges']:
+            metric = latest.get((page['label'], gauge['name']))
+            if metric is None:
+                continue
+            value = metric['value']
+            unit = metric.get('unit') or ''
+            where = f"{page['label']} {gauge['name']}"
+            threshold = gauge.get('threshold')
+            if threshold is not None and value > threshold:
+                alerts.append({
+                    'host': page['label'], 'gauge': gauge['name'], 'kind': 'threshold',
+                    'value': value, 'unit': unit, 'limit': threshold,
+                    'message': f"{where} 当前 {value:g}{unit} 超过阈值 {threshold:g}{unit}",
+                })
+            max_delta = gauge.get('max_delta')
+            if max_delta is not None and store is not None:
+                previous = store.latest(page['label'], gauge['name'], before=metric['ts'])
+                if previous is not None and abs(value - previous['value']) > max_delta:
+                    delta = value - previous['value']
+                    alerts.append({
+                        'host': page['label'], 'gauge': gauge['name'], 'kind': 'delta',
+                        'value': value, 'unit': unit, 'limit': max_delta,
+                        'previous': previous['value'], 'previous_ts': previous['ts'],
+                        'message': f"{where} 从 {previous['value']:g}{unit}（{previous['ts']}）变为 {value:g}{unit}，"
+                                   f"变化 {delta:+g} 超过 {max_delta:g}",
+                    })
+    return alerts
+
+def publish_alerts(alerts, folder, report=None):
+    """记录告警日志并保存到日期文件夹，配置了告警地址时同时发送，返回告警文件路径"""
+    for alert in alerts:
+        logger.warning(f"[告警] {alert['message']}")
+    if report is not None:
+        with report.lock:
+            report.alerts.extend(alerts)
+    
+    path = os.path.join(folder, f"告警_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(alerts, f, ensure_ascii=False, indent=2)
+        logger.info(f"告警已保存: {path}")
+    except OSError as e:
+        logger.error(f"保存告警失败: {str(e)}")
+    
+    if ALERT_WEBHOOK_URL:
+        payload = {
+            'text': "Zabbix日常检查告警\n" + "\n".join(alert['message'] for alert in alerts),
+            'alerts': alerts,
+        }
+        try:
+            request = urllib.request.Request(
+                ALERT_WEBHOOK_URL,
+                data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                headers={'Content-Type': 'application/json; charset=utf-8'},
+                method='POST',
+            )
+            with urllib.request.urlopen(request, timeout=ALERT_WEBHOOK_TIMEOUT) as response:
+                logger.info(f"告警已发送到 {ALERT_WEBHOOK_URL}，HTTP {response.status}")
+        # 地址格式错误（InvalidURL）或响应异常（BadStatusLine）属于HTTPException，不是OSError
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            logger.error(f"发送告警失败: {str(e)}")
+    return path
+
+def split_cell_values(text, column_gauges):
+    """把一个单元格中按行拼接的多个仪表盘文本拆开并去掉前缀，返回 {仪表盘名称: 文本}"""
+    lines = str(text).split("\n") if text is not None else []
+    values = {}
+    for gauge, line in zip(column_gauges, lines):
+        prefix = gauge.get('prefix', '')
+        if prefix and line.startswith(prefix):
+            line = line[len(prefix):]
+        values[gauge['name']] = line
+    return values
+
+def backfill_metrics(inventory, root=None, store=None):
+    """从已有的 MM-DD 日期文件夹中的日常检查表导入历史指标，返回导入条数"""
+    from openpyxl import load_workbook
+    root = root or os.getcwd()
+    own_store = store is None
+    if own_store:
+        store = MetricsStore()
+    total = 0
+    try:
+        for folder_name in sorted(os.listdir(root)):
+            match = re.match(r'^(\d{2})-(\d{2})$', folder_name)
+            excel_file = os.path.join(root, folder_name, "日常检查表.xlsx")
+            if not match or not os.path.exists(excel_file):
+                continue
+            
+            # 文件夹名只有月日，年份和时间取自工作簿的修改时间；修改日期与文件夹不一致时按当天零点记录
+            modified = datetime.fromtimestamp(os.path.getmtime(excel_file))
+            month, day = int(match.group(1)), int(match.group(2))
+            year = modified.year if (month, day) <= (modified.month, modified.day) else modified.year - 1
+            if (modified.month, modified.day) == (month, day):
+                ts = modified.strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                ts = f"{year:04d}-{month:02d}-{day:02d} 00:00:00"
+            
+            try:
+                workbook = load_workbook(excel_file, read_only=True, data_only=True)
+            except Exception as e:
+                logger.error(f"读取 {excel_file} 失败: {str(e)}")
+                continue
+            records = []
+            try:
+                worksheet = workbook.active
+                for page in build_pages(inventory, "", ""):
+                    for column, column_gauges in page_columns(page).items():
+                        cell_value = worksheet[f"{column}{page['row']}"].value
+                        for gauge_name, text in split_cell_values(cell_value, column_gauges).items():
+                            value, unit = parse_gauge_text(text)
+                            if value is not None:
+                                records.append({'ts': ts, 'host': page['label'], 'gauge': gauge_name, 'value': value, 'unit': unit})
+            finally:
+                workbook.close()
+            # 运行时已写入（时间为运行开始时间而非工作簿修改时间）或已回填过的主机和仪表盘当天不再导入，避免重复
+            recorded = store.recorded_on(ts[:10])
+            skipped = len(records)
+            records = [record for record in records if (record['host'], record['gauge']) not in recorded]
+            skipped -= len(records)
+            if records:
+                total += store.append(records, source="backfill")
+            logger.info(f"{folder_name}: 导入 {len(records)} 条指标" + (f"，跳过当天已有的 {skipped} 条" if skipped else ""))
+    finally:
+        if own_store:
+            store.close()
+    logger.info(f"历史指标回填完成，共导入 {total} 条")
+    return total
+
+def print_trend(host, gauge, days):
+    """在控制台输出某主机某仪表盘最近days天的趋势"""
+    with MetricsStore() as store:
+        rows, summary = store.trend(host, gauge, days)
+    if not rows:
+        print(f"{host} {gauge} 最近{days}天没有历史数据")
+        return
+    for row in rows:
+        print(f"{row['ts']}  {row['value']:.2f} {row['unit']}")
+    print(f"共{summary['count']}条  最小 {summary['min']:.2f}  最大 {summary['max']:.2f}  "
+          f"变化 {summary['change']:+.2f}（{summary['first']['ts'][:10]} -> {summary['last']['ts'][:10]}）")
+
+def print_run_report(today):
+    """在控制台输出某天最近一次运行报告的摘要：耗时、各阶段耗时、失败的页面和告警"""
+    date_folder = date_folder_path(today)
+    reports = sorted(name for name in os.listdir(date_folder)
+                     if name.startswith("运行报告_") and name.endswith(".json")) if os.path.isdir(date_folder) else []
+    if not reports:
+        print(f"{today} 没有运行报告")
+        return
+    path = os.path.join(date_folder, reports[-1])
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    print(f"运行报告: {path}")
+    print(f"开始时间 {report['started_at']}  总耗时 {report['total_seconds']:.2f}s  "
+          f"仪表盘成功 {report['gauges_ok']}  失败 {report['gauges_failed']}")
+    for stage, duration in sorted(report['stages'].items(), key=lambda item: -item[1]):
+        print(f"  {stage:<16} {duration:8.2f}s")
+    for label, page in report['pages'].items():
+        if page.get('status') not in (None, 'ok'):
+            print(f"  页面 {label}: {page['status']}")
+    for alert in report.get('alerts', []):
+        print(f"  告警 {alert['message']}")
+
+def parse_schedule(text):
+    """解析 "08:30,14:00" 形式的每日运行时间，返回排好序的 (时, 分) 列表"""
+    times = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r'(\d{1,2}):(\d{2})', part)
+        if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+            raise ValueError(f"无效的运行时间: {part}")
+        times.add((int(match.group(1)), int(match.group(2))))
+    return sorted(times)
+
+def next_run_time(schedule, now=None):
+    """计算下一次计划运行的时间，没有计划时返回None"""
+    if not schedule:
+        return None
+    now = now or datetime.now()
+    for hour, minute in schedule:
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate > now:
+            return candidate
+    hour, minute = schedule[0]
+    return (now + timedelta(days=1)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+class CaptureDaemon:
+    """常驻模式：保持解释器和已登录的浏览器，按每日计划运行，并通过本机HTTP接口接受手动触发"""
+    
+    def __init__(self, schedule, port=None, concurrency=None):
+        self.schedule = schedule
+        self.port = DAEMON_PORT if port is None else port
+        self.concurrency = max(1, CAPTURE_CONCURRENCY if concurrency is None else concurrency)
+        self.drivers = []
+        self.run_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.next_run = None
+        self.last_run = None
+        self.server = None
+    
+    def _pool_size(self):
+        """常驻浏览器数量：多个服务器同时采集时按服务器轮流分配浏览器，每个服务器各需并发数个"""
+        try:
+            inventory = load_inventory()
+        except InventoryError:
+            return self.concurrency
+        servers = {host.get('server', DEFAULT_SERVER_NAME) for host in inventory['hosts']}
+        return self.concurrency * max(1, len(servers))
+    
+    def _ensure_drivers(self):
+        """检查常驻浏览器是否仍可用，关闭失效的和多余的，并补足到每个服务器的并发数"""
+        from selenium.common.exceptions import WebDriverException
+        size = self._pool_size()
+        alive = []
+        for driver in self.drivers:
+            try:
+                driver.current_url
+                alive.append(driver)
+            except WebDriverException as e:
+                logger.warning(f"常驻浏览器已失效，重新启动: {str(e)[:100]}")
+                try:
+                    driver.quit()
+                except WebDriverException:
+                    pass
+        # 服务器减少时关闭多余的浏览器
+        for driver in alive[size:]:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+        self.drivers = alive[:size]
+        while len(self.drivers) < size:
+            driver = create_edge_driver()
+            if driver is None:
+                break
+            self.drivers.append(driver)
+    
+    def _park_drivers(self):
+        """运行结束后让常驻浏览器离开仪表盘页面，避免小部件自动刷新持续请求Zabbix；下次运行时按缓存的会话重新进入"""
+        from selenium.common.exceptions import WebDriverException
+        for driver in self.drivers:
+            try:
+                driver.get("about:blank")
+            except WebDriverException as e:
+                logger.warning(f"常驻浏览器切换到空白页失败: {str(e)[:100]}")
+    
+    def run_once(self, trigger, wait=True):
+        """执行一次截图任务，返回运行报告摘要；wait为False且已有任务在运行时返回None"""
+        if not self.run_lock.acquire(blocking=wait):
+            return None
+        try:
+            logger.info(f"常驻模式开始运行（{trigger}）")
+            self._ensure_drivers()
+            try:
+                report = take_screenshots(drivers=self.drivers or None)
+            finally:
+                self._park_drivers()
+            summary = report.to_dict() if report is not None else {'error': "主机清单无效"}
+            summary['trigger'] = trigger
+            self.last_run = summary
+            logger.info(f"常驻模式运行结束（{trigger}）")
+            return summary
+        finally:
+            self.run_lock.release()
+    
+    def status(self):
+        return {
+            'running': self.run_lock.locked(),
+            'next_run': self.next_run.strftime("%Y-%m-%d %H:%M:%S") if self.next_run else None,
+            'browsers': len(self.drivers),
+            'last_run': self.last_run,
+        }
+    
+    def _make_handler(self):
+        daemon = self
+        
+        class TriggerHandler(BaseHTTPRequestHandler):
+            def _send_json(self, status, data):
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                if self.path == '/status':
+                    self._send_json(200, daemon.status())
+                else:
+                    self._send_json(404, {'error': "未知路径，可用 GET /status 或 POST /run"})
+            
+            def do_POST(self):
+                if self.path != '/run':
+                    self._send_json(404, {'error': "未知路径，可用 GET /status 或 POST /run"})
+                    return
+                summary = daemon.run_once("手动触发", wait=False)
+                if summary is None:
+                    self._send_json(409, {'error': "已有任务正在运行"})
+                else:
+                    self._send_json(200, summary)
+            
+            def log_message(self, format, *args):
+                logger.info(f"触发接口 {self.address_string()} {format % args}")
+        
+        return TriggerHandler
+    
+    def _wait_until(self, when):
+        """等待到指定时间，收到停止信号时返回False；when为None时一直等待。
+        Windows下长时间阻塞的等待不响应Ctrl+C，因此分成短时间片等待"""
+        while True:
+            remaining = DAEMON_WAIT_SLICE if when is None else (when - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return True
+            if self.stop_event.wait(min(remaining, DAEMON_WAIT_SLICE)):
+                return False
+    
+    def serve_forever(self):
+        """启动触发接口并按计划循环运行，直到收到中断"""
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self._make_handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="trigger", daemon=True).start()
+        logger.info(f"常驻模式已启动，触发接口: http://127.0.0.1:{self.port}/run，"
+                    f"计划时间: {', '.join(f'{h:02d}:{m:02d}' for h, m in self.schedule) or '无'}")
+        
+        # 预先启动浏览器，首次触发时无需等待浏览器启动
+        with self.run_lock:
+            self._ensure_drivers()
+        try:
+            while not self.stop_event.is_set():
+                self.next_run = next_run_time(self.schedule)
+                if not self._wait_until(self.next_run):
+                    break
+                try:
+                    self.run_once("计划运行")
+                except Exception as e:
+                    logger.error(f"计划运行失败: {str(e)}")
+                    logger.error(f"详细错误信息: {traceback.format_exc()}")
+        except KeyboardInterrupt:
+            logger.info("收到中断，常驻模式退出")
+        finally:
+            self.close()
+    
+    def close(self):
+        from selenium.common.exceptions import WebDriverException
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for driver in self.drivers:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+        self.drivers = []
+
+def main(argv=None):
+    global _startup_seconds
+    parser = argparse.ArgumentParser(description="Zabbix仪表盘自动截图与日常检查，不指定子命令时执行 capture")
+    subparsers = parser.add_subparsers(dest="command", metavar="子命令")
+    subparsers.add_parser("capture", help="截图、提取仪表盘数据并写入Excel")
+    subparsers.add_parser("extract-only", help="只提取仪表盘数据写入Excel，不截图；API模式下不启动浏览器")
+    combine_parser = subparsers.add_parser("combine-only", help="重新合并某天已保存的主机截图")
+    combine_parser.add_argument("--date", help="日期，格式为YYYYMMDD，默认今天")
+    render_parser = subparsers.add_parser("render", help="从某天的流式结果文件（csv/xlsx输出方式）生成日常检查表")
+    render_parser.add_argument("--date", help="日期，格式为YYYYMMDD，默认今天")
+    render_parser.add_argument("--force", action="store_true", help="从模板重新生成，覆盖日期文件夹中已有的日常检查表")
+    report_parser = subparsers.add_parser("report", help="查看某天最近一次运行的报告")
+    report_parser.add_argument("--date", help="日期，格式为YYYYMMDD，默认今天")
+    subparsers.add_parser("backfill", help="从已有日期文件夹的日常检查表导入历史指标")
+    trend_parser = subparsers.add_parser("trend", help="查询某主机某仪表盘的历史趋势，例如 trend QZPMS D盘")
+    trend_parser.add_argument("host", metavar="主机")
+    trend_parser.add_argument("gauge", metavar="仪表盘")
+    trend_parser.add_argument("--days", type=int, default=90, help="趋势查询的天数，默认90")
+    daemon_parser = subparsers.add_parser("daemon", help="常驻运行，按计划时间截图并开放本机触发接口")
+    daemon_parser.add_argument("--schedule", default=DAEMON_SCHEDULE, help="每天的运行时间，例如 08:30,14:00，留空表示只接受手动触发")
+    daemon_parser.add_argument("--port", type=int, default=DAEMON_PORT, help="触发接口端口")
+    args = parser.parse_args(argv)
+    
+    date_str = getattr(args, 'date', None)
+    if date_str is not None:
+        try:
+            datetime.strptime(date_str, "%Y%m%d")
+        except ValueError:
+            parser.error(f"无效的日期: {date_str}，格式应为YYYYMMDD")
+    date_str = date_str or datetime.now().strftime("%Y%m%d")
+    
+    setup_logging()
+    _startup_seconds = time.perf_counter() - PROCESS_START
+    logger.info(f"程序开始执行（{args.command or 'capture'}）")
+    
+    if args.command in (None, "capture"):
+        take_screenshots()
+    elif args.command == "extract-only":
+        take_screenshots(capture=False)
+    elif args.command == "combine-only":
+        try:
+            combine_saved_images(date_str)
+        except InventoryError as e:
+            logger.error(f"主机清单无效: {str(e)}")
+    elif args.command == "render":
+        render_workbook(date_str, force=args.force)
+    elif args.command == "report":
+        print_run_report(date_str)
+    elif args.command == "trend":
+        print_trend(args.host, args.gauge, args.days)
+    elif args.command == "daemon":
+        try:
+            schedule = parse_schedule(args.schedule)
+        except ValueError as e:
+            parser.error(str(e))
+        CaptureDaemon(schedule, args.port).serve_forever()
+    elif args.command == "backfill":
+        try:
+            backfill_metrics(load_inventory())
+        except InventoryError as e:
+            logger.error(f"主机清单无效: {str(e)}")
+    logger.info("程序执行结束")
+
 if __name__ == "__main__":
-    logger.info("程序开始执行")
-    take_screenshots()
-    logger.info("程序执行结束")
\ No newline at end of file
+    main()